@@ -0,0 +1,155 @@
+'''
+Deadline-enforced asynchronous execution of player bots.
+
+AsyncPlayer wraps any player and runs it in a worker thread. As soon as a step
+starts, the bot receives a frozen copy of the game (see Game.snapshot) and starts
+thinking while the game loop keeps rendering and handling input. When the step
+is due, the bot's answer is used if it is ready; otherwise a fallback action is
+taken and a deadline miss is recorded. Exceptions raised by the bot are counted
+and answered with the fallback as well, instead of ending the game.
+
+    bot = AsyncPlayer(SimplePlayer(), deadline=0.030, fallback='safe')
+    bot.submit(game)          # right after a step
+    ...                       # render, handle input
+    action = bot.collect()    # when the next step is due
+
+A thread cannot be interrupted, so a bot that never returns keeps its worker
+busy; the game goes on with fallback actions until it answers.
+'''
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from time import perf_counter
+
+import numpy as np
+
+from player import BasePlayer
+
+
+def keep_direction(App):
+    """Fallback that keeps the current direction."""
+    return None
+
+
+def safe_move(App):
+    """Fallback that keeps the current direction if it is safe, and otherwise
+    turns into the first direction that does not kill the snake."""
+
+    snake = App.snake
+    current = snake.current_direction
+    for direction in [current] + [d for d in snake.directions if d != current]:
+        if direction != snake.directions[current] and \
+           not App._check_death(snake=snake.change_direction(direction, return_copy=True)):
+            return direction
+    return None
+
+
+FALLBACKS = {'keep': keep_direction, 'safe': safe_move}
+
+
+class AsyncPlayer(BasePlayer):
+    """Runs a player in a worker thread with a hard deadline per step."""
+
+    def __init__(self, player, deadline=0.030, fallback='keep', history=10000):
+        """
+        Wraps player. deadline is the time in seconds a bot may think when it is called
+        synchronously (see __call__). fallback is 'keep', 'safe' or a function that takes
+        the game and returns an action. The latencies of the last history calls are kept.
+        """
+        super().__init__()
+        self.player = player
+        self.bot_name = player.bot_name
+        self.bot_version = player.bot_version
+        self.observation = player.observation
+        self.deadline = deadline
+        self.fallback = FALLBACKS[fallback] if isinstance(fallback, str) else fallback
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'bot-{self.bot_name}')
+        self._future = None
+        self._busy = False
+        self._game = None
+
+        # statistics, also reported to a profiler.Profiler if one is set
+        self.profiler = None
+        self.calls = 0
+        self.deadline_misses = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=history)
+
+    def _think(self, game):
+        """Runs in the worker thread. Records how long the bot took, even if it is late."""
+        tstart = perf_counter()
+        try:
+            return self.player(game)
+        finally:
+            latency = perf_counter() - tstart
+            self.latencies.append(latency)
+            if self.profiler is not None:
+                self.profiler.record('bot_decision', latency)
+
+    def submit(self, App):
+        """Starts the bot on a copy of the current game state. Returns False if the bot is
+        still busy with an earlier step, in which case this step gets the fallback."""
+
+        game = getattr(App, 'game', App)
+        self._game = game
+
+        # a late answer for an earlier step is dropped, a bot that is still thinking is left alone
+        future = self._future
+        if future is not None and not future.done() and not future.cancel():
+            self._busy = True
+            return False
+
+        self._busy = False
+        self._future = self._executor.submit(self._think, game.snapshot(observation=bool(self.observation)))
+        return True
+
+    def collect(self, timeout=0):
+        """Returns the bot's action for the submitted step, waiting at most timeout seconds.
+        Late or failed answers are replaced by the fallback action."""
+
+        self.calls += 1
+        future = self._future
+        if future is None:
+            return self.fallback(self._game) if self._game is not None else None
+
+        try:
+            if self._busy:
+                raise TimeoutError
+            action = future.result(timeout=timeout)
+            self._future = None
+            return action
+
+        except TimeoutError:
+            self.deadline_misses += 1
+            if self.profiler is not None:
+                self.profiler.count('deadline_misses')
+        except Exception as error:
+            self.errors += 1
+            self._future = None
+            if self.errors == 1:
+                print(f'{self.bot_name} raised {error!r}. Using the fallback action from now on whenever it fails.')
+
+        return self.fallback(self._game)
+
+    def __call__(self, App):
+        """Synchronous use: think about the current state for at most deadline seconds."""
+        self.submit(App)
+        return self.collect(timeout=self.deadline)
+
+    def stats(self):
+        """Returns the call counts and the latency percentiles in milliseconds."""
+
+        latencies = 1000 * np.array(self.latencies) if self.latencies else np.full(1, np.nan)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {'bot_name': self.bot_name,
+                'calls': self.calls,
+                'deadline_misses': self.deadline_misses,
+                'errors': self.errors,
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99)}
+
+    def shutdown(self):
+        """Stops the worker thread without waiting for a bot that is still thinking."""
+        self._executor.shutdown(wait=False)
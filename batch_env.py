@@ -0,0 +1,240 @@
+'''
+Vectorized batch environment that advances many games of snake in lockstep.
+All boards are stored in NumPy arrays and every step is a handful of array
+operations, no matter how many games are running. Finished games are reset
+automatically, which makes it easy to score a whole population of bots.
+
+The rules are the same as in the single-game engine (engine.py): the snake
+dies when its next head position leaves the grid or hits its own body (the
+tail cell is safe because it moves away, unless the snake eats), it
+grows by one cell when it eats, and new food never spawns on the snake.
+
+Positions are given in cells, not pixels: x is the column, y the row.
+Actions are integer codes, see ACTIONS. A code of -1 keeps the current direction.
+
+A player decides for all games at once in its my_bot_batch method, which gets
+the BatchGame itself and reads the stacked arrays (or features()) from it:
+
+    games = BatchGame(4096, seed=0)
+    games.play(player, n_steps=1000)
+
+Players that only implement my_bot are called once per game by the default
+adapter in BasePlayer, on a single-game copy built by BatchGame.game(i).
+'''
+
+import numpy as np
+
+from engine import Game, DIRECTIONS
+
+
+# action/direction codes (those of engine.DIRECTION_CODES) and their effect on the head position
+ACTIONS = DIRECTIONS
+OPPOSITE = np.array([1, 0, 3, 2], dtype=np.int8)
+DX = np.array([0, 0, -1, 1], dtype=np.int32)
+DY = np.array([-1, 1, 0, 0], dtype=np.int32)
+
+
+class BatchGame:
+    """N games of snake stored as arrays and stepped together."""
+
+    def __init__(self, n_games, n_cols=40, n_rows=40, seed=None):
+        """Constructs the batch. Every game is started right away."""
+
+        self.n_games = n_games
+        self.n_cols = n_cols
+        self.n_rows = n_rows
+        self.n_cells = n_cols * n_rows
+        self.rng = np.random.default_rng(seed)
+        self._idx = np.arange(n_games)
+
+        # Game state. The body of game i is the ring buffer body[i] that starts at
+        # tail[i] and holds length[i] flat cell indices (y*n_cols + x), head last.
+        self.head_x = np.zeros(n_games, dtype=np.int32)
+        self.head_y = np.zeros(n_games, dtype=np.int32)
+        self.direction = np.zeros(n_games, dtype=np.int8)
+        self.body = np.zeros((n_games, self.n_cells), dtype=np.int32)
+        self.tail = np.zeros(n_games, dtype=np.int32)
+        self.length = np.zeros(n_games, dtype=np.int32)
+        self.occupied = np.zeros((n_games, self.n_cells), dtype=bool)
+        self.food = np.zeros(n_games, dtype=np.int32)
+
+        # Scores of the running games, same meaning as in Game.score and Game.iteration
+        self.iteration = np.ones(n_games, dtype=np.int64)
+        self.food_eaten = np.zeros(n_games, dtype=np.int32)
+        self.mean_steps_per_food = np.full(n_games, np.nan)
+
+        # Scores of the last finished game in every slot
+        self.episodes = np.zeros(n_games, dtype=np.int64)
+        self.final_food_eaten = np.zeros(n_games, dtype=np.int32)
+        self.final_steps = np.zeros(n_games, dtype=np.int64)
+        self.final_won = np.zeros(n_games, dtype=bool)
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """Starts new games in all slots, or only where mask is True."""
+
+        games = self._idx if mask is None else self._idx[mask]
+        n = len(games)
+        if n == 0:
+            return
+
+        # Create and place snakes
+        x = self.rng.integers(self.n_cols, size=n)
+        y = self.rng.integers(self.n_rows, size=n)
+        cell = y * self.n_cols + x
+        self.head_x[games] = x
+        self.head_y[games] = y
+        self.direction[games] = self.rng.integers(4, size=n)
+        self.occupied[games] = False
+        self.occupied[games, cell] = True
+        self.body[games, 0] = cell
+        self.tail[games] = 0
+        self.length[games] = 1
+
+        # Reset scores
+        self.iteration[games] = 1
+        self.food_eaten[games] = 0
+        self.mean_steps_per_food[games] = np.nan
+
+        # Create and place food
+        self._place_food(games)
+
+    def _place_food(self, games):
+        """Places food on a uniformly drawn free cell for each of the given games.
+        Returns a mask of the games whose board is full, i.e. that have been won."""
+
+        free = ~self.occupied[games]
+        n_free = free.sum(axis=1)
+        full = n_free == 0
+
+        # pick the r-th free cell of every board
+        r = (self.rng.random(len(games)) * n_free).astype(np.int64)
+        self.food[games] = np.argmax(np.cumsum(free, axis=1) > r[:, None], axis=1)
+
+        return full
+
+    def step(self, actions=None):
+        """
+        Advances all games by one step. This consists of 4 steps.
+            Step 1. Apply the actions (-1 keeps the current direction, opposite directions are ignored).
+            Step 2. Check which snakes die by leaving the grid or hitting their own body.
+            Step 3. Move the surviving snakes, growing those that eat and placing new food.
+            Step 4. Record the scores of finished games and reset them.
+        Returns two boolean arrays (ate, done). A game is done when the snake dies
+        or when it fills the whole board, which is recorded in final_won.
+        """
+
+        # Step 1
+        if actions is not None:
+            actions = np.asarray(actions)
+            turn = (actions >= 0) & (actions != OPPOSITE[self.direction])
+            self.direction[turn] = actions[turn]
+
+        # Step 2
+        self.iteration += 1
+        new_x = self.head_x + DX[self.direction]
+        new_y = self.head_y + DY[self.direction]
+        outside = (new_x < 0) | (new_x >= self.n_cols) | (new_y < 0) | (new_y >= self.n_rows)
+        new_cell = np.where(outside, 0, new_y * self.n_cols + new_x)
+        eats = new_cell == self.food
+        into_tail = new_cell == self.body[self._idx, self.tail]
+        dead = outside | (self.occupied[self._idx, new_cell] & (eats | ~into_tail))
+        alive = ~dead
+        ate = alive & eats
+
+        # Step 3
+        games = self._idx[alive]
+        cell = new_cell[alive]
+        head_slot = (self.tail[games] + self.length[games]) % self.n_cells
+
+        # the tail cell is vacated unless the snake has eaten
+        shrink = games[~ate[alive]]
+        self.occupied[shrink, self.body[shrink, self.tail[shrink]]] = False
+        self.tail[shrink] = (self.tail[shrink] + 1) % self.n_cells
+
+        self.body[games, head_slot] = cell
+        self.occupied[games, cell] = True
+        self.head_x[games] = new_x[alive]
+        self.head_y[games] = new_y[alive]
+
+        done = dead
+        eaters = self._idx[ate]
+        if len(eaters):
+            self.mean_steps_per_food[eaters] = np.round((self.iteration[eaters]+1)/(self.food_eaten[eaters]+1), 2)
+            self.length[eaters] += 1
+            self.food_eaten[eaters] += 1
+            won = eaters[self._place_food(eaters)]
+            if len(won):
+                done = dead.copy()
+                done[won] = True
+
+        # Step 4
+        if done.any():
+            self.final_food_eaten[done] = self.food_eaten[done]
+            self.final_steps[done] = self.iteration[done] - 1
+            self.final_won[done] = ~dead[done]
+            self.episodes[done] += 1
+            self.reset(done)
+
+        return ate, done
+
+    def body_cells(self, game):
+        """Returns the body of one game as a list of [x, y] cells, tail first and head last."""
+
+        slots = (self.tail[game] + np.arange(self.length[game])) % self.n_cells
+        cells = self.body[game, slots]
+        return [[int(c % self.n_cols), int(c // self.n_cols)] for c in cells]
+
+    def food_cells(self):
+        """Returns the food positions of all games as an (N, 2) array of [x, y] cells."""
+        return np.stack([self.food % self.n_cols, self.food // self.n_cols], axis=1)
+
+    def danger(self):
+        """Returns an (N, 4) boolean array that tells whether moving up, down, left or right
+        kills the snake, with the same rules as step()."""
+
+        tail_cell = self.body[self._idx, self.tail]
+        danger = np.empty((self.n_games, 4), dtype=bool)
+        for action in range(4):
+            x = self.head_x + DX[action]
+            y = self.head_y + DY[action]
+            outside = (x < 0) | (x >= self.n_cols) | (y < 0) | (y >= self.n_rows)
+            cell = np.where(outside, 0, y * self.n_cols + x)
+            danger[:, action] = outside | (self.occupied[self._idx, cell] & ((cell == self.food) | (cell != tail_cell)))
+        return danger
+
+    def features(self):
+        """Returns the features of all games as an (N, 9) float32 array with the same
+        columns as an Observation (see observation.FEATURES)."""
+
+        food_x, food_y = self.food % self.n_cols, self.food // self.n_cols
+        return np.column_stack([self.danger(), food_y < self.head_y, food_y > self.head_y,
+                                food_x < self.head_x, food_x > self.head_x,
+                                self.length / self.n_cells]).astype(np.float32)
+
+    def game(self, i):
+        """
+        Returns an engine.Game with the state of game i, for bots that only implement my_bot.
+        Positions are in cells (cell size 1, no margins). The copy is independent: stepping
+        it does not change the batch, and the food it places differs. Costs O(length).
+        """
+
+        slots = (self.tail[i] + np.arange(self.length[i])) % self.n_cells
+        game = Game.from_cells(self.n_cols, self.n_rows, self.body[i, slots], ACTIONS[self.direction[i]],
+                               int(self.food[i]), int(self.iteration[i]))
+        game.mean_steps_per_food = '-' if np.isnan(self.mean_steps_per_food[i]) else float(self.mean_steps_per_food[i])
+        game.score = {'food_eaten': int(self.food_eaten[i]), 'mean steps per food': game.mean_steps_per_food}
+        return game
+
+    def play(self, player, n_steps):
+        """
+        Plays n_steps steps of all games. In every step, player.my_bot_batch(self) decides
+        for all games at once and returns an array of action codes. Returns the number of
+        games that were finished.
+        """
+
+        episodes = int(self.episodes.sum())
+        for _ in range(n_steps):
+            self.step(player.my_bot_batch(self))
+        return int(self.episodes.sum()) - episodes
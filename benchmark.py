@@ -0,0 +1,246 @@
+'''
+Benchmarks of the engine, the bots and the renderer.
+
+Synthetic games are built with snakes of 1 cell up to a nearly full board on
+boards from 20x20 to 400x400 cells. For each of them the cost per call of
+Snake.move, Game._check_death, Game._place_food and SimplePlayer.my_bot is
+measured, as well as the cost per frame of the App renderers (the array
+renderer on boards up to 1000x1000) and whole headless games per second for
+every bundled player. Results are saved as JSON and compared against a baseline;
+anything slower than the baseline by more than the threshold is flagged.
+
+$ python benchmark.py --quick --output bench.json
+$ python benchmark.py --output bench.json --save-baseline benchmark_baseline.json
+$ python benchmark.py --output bench.json --baseline benchmark_baseline.json --threshold 0.2
+'''
+
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from engine import Game, FreeCells
+from batch_env import BatchGame
+from player import HumanPlayer, RandomPlayer, SimplePlayer
+from genetic import GeneticPlayer
+
+
+BOARDS = (20, 40, 100, 400)
+QUICK_BOARDS = (20, 40, 100)
+RENDER_BOARDS = (40, 100, 400, 1000)
+QUICK_RENDER_BOARDS = (40, 100)
+FILLS = (0, 0.1, 0.5, 0.9)  # snake length as a fraction of the board (0 means a single cell)
+
+
+def make_game(n_cells_x, n_cells_y, length, cell_size=10, seed=0):
+    """
+    Returns a game on a board of n_cells_x by n_cells_y cells with a snake of the given
+    length that winds through the board row by row, like a serpentine. The head points
+    to a free cell whenever there is one next to it.
+    """
+
+    game = Game(grid_size=(n_cells_x*cell_size, n_cells_y*cell_size), cell_size=cell_size, seed=seed)
+
+    cells = []
+    for row in range(n_cells_y):
+        cols = range(n_cells_x) if row % 2 == 0 else range(n_cells_x-1, -1, -1)
+        cells.extend(row*n_cells_x + col for col in cols)
+    cells = cells[:max(length, 1)]
+    game.snake.body = [game.cell_position(cell) for cell in cells]
+
+    game.free_cells = FreeCells(n_cells_x*n_cells_y)
+    for cell in cells:
+        game.free_cells.remove(cell)
+    game._place_food()
+    game.rehash()
+
+    # point the head along its row, or down at the end of the row
+    row, col = divmod(cells[-1], n_cells_x)
+    along = 'right' if row % 2 == 0 else 'left'
+    at_end = col == (n_cells_x-1 if along == 'right' else 0)
+    game.snake.current_direction = 'down' if at_end else along
+
+    return game
+
+
+def per_call(function, min_time=0.2, repeats=3):
+    """Returns the median over repeats of the mean time per call of function(), in seconds."""
+
+    # find a number of calls that takes at least min_time / repeats
+    n = 1
+    while True:
+        tstart = perf_counter()
+        for _ in range(n):
+            function()
+        elapsed = perf_counter() - tstart
+        if elapsed >= min_time / repeats:
+            break
+        n *= 4
+
+    times = [elapsed / n]
+    for _ in range(repeats - 1):
+        tstart = perf_counter()
+        for _ in range(n):
+            function()
+        times.append((perf_counter() - tstart) / n)
+    return float(np.median(times))
+
+
+def bench_engine(boards, min_time):
+    """Cost per call of the engine and of SimplePlayer on synthetic states."""
+
+    results = {}
+    player = SimplePlayer()
+    for size in boards:
+        for fill in FILLS:
+            length = max(1, int(fill * size * size))
+            key = f'{size}x{size}/len{length}'
+
+            game = make_game(size, size, length)
+            results[f'check_death/{key}'] = per_call(game._check_death, min_time)
+            results[f'place_food/{key}'] = per_call(game._place_food, min_time)
+            results[f'simple_bot/{key}'] = per_call(lambda: player.my_bot(game), min_time)
+
+            # moving changes the snake, so every measurement gets a fresh one
+            game = make_game(size, size, length)
+            results[f'snake_move/{key}'] = per_call(game.snake.move, min_time)
+
+    return {name: {'value': 1e6*seconds, 'unit': 'us', 'better': 'lower'} for name, seconds in results.items()}
+
+
+def bench_render(boards, min_time):
+    """Cost per frame of the full and the incremental cell renderer of the App on a 40x40
+    board, and of the array renderer on the given boards."""
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from snake_game import App
+
+    def new_app(size, renderer):
+        app = App(board_size=(size, size), renderer=renderer)
+        app.results_path = None
+        app.on_init()
+        app.bot.shutdown()
+        return app
+
+    results = {}
+    app = new_app(40, 'cells')
+    for fill in FILLS:
+        length = max(1, int(fill * 40 * 40))
+        key = f'40x40/len{length}'
+        app.game = make_game(40, 40, length)
+        results[f'render_full/{key}'] = per_call(app._render_full, min_time)
+
+        # incremental frames: one step of the game per frame, only the rendering is timed
+        app.game = make_game(40, 40, length)
+        app._rendered = None
+        app.on_render()
+        elapsed, frames = 0., 0
+        while elapsed < min_time and not app.game.done:
+            app.game.step()
+            tstart = perf_counter()
+            app.on_render()
+            elapsed += perf_counter() - tstart
+            frames += 1
+        if frames:
+            results[f'render_step/{key}'] = elapsed / frames
+
+    # the array renderer repaints the whole board in every frame
+    for size in boards:
+        app = new_app(size, 'array')
+        for fill in FILLS:
+            length = max(1, int(fill * size * size))
+            app.game = make_game(size, size, length)
+            app.game.observe()
+            app._rendered = (app.snake, 0)
+            results[f'render_array/{size}x{size}/len{length}'] = per_call(app._render_array, min_time)
+
+    pygame.quit()
+    return {name: {'value': 1e6*seconds, 'unit': 'us', 'better': 'lower'} for name, seconds in results.items()}
+
+
+def bench_games(min_time):
+    """Whole headless games per second and steps per second for every bundled player.
+    Games are cut off after 10000 steps, so bots that run in circles still finish."""
+
+    results = {}
+    for player_class in (HumanPlayer, RandomPlayer, SimplePlayer, GeneticPlayer):
+        np.random.seed(0)
+        game = Game()
+        games = steps = 0
+        tstart = perf_counter()
+        while perf_counter() - tstart < min_time or games == 0:
+            game.reset(games)
+            game.play(player_class(), max_steps=10000)
+            games += 1
+            steps += game.iteration - 1
+        elapsed = perf_counter() - tstart
+        name = player_class().bot_name
+        results[f'games_per_s/{name}'] = {'value': games / elapsed, 'unit': '1/s', 'better': 'higher'}
+        results[f'steps_per_s/{name}'] = {'value': steps / elapsed, 'unit': '1/s', 'better': 'higher'}
+
+    batch = BatchGame(1024, seed=0)
+    actions = np.random.default_rng(0).integers(-1, 4, size=(64, 1024))
+    seconds = per_call(lambda: [batch.step(a) for a in actions], min_time) / len(actions)
+    results['steps_per_s/batch1024'] = {'value': 1024 / seconds, 'unit': '1/s', 'better': 'higher'}
+
+    # a network policy that decides for all 1024 games in one call of my_bot_batch
+    np.random.seed(0)
+    player = GeneticPlayer()
+    seconds = per_call(lambda: batch.play(player, 16), min_time) / 16
+    results['steps_per_s/batch1024_genetic'] = {'value': 1024 / seconds, 'unit': '1/s', 'better': 'higher'}
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the names of the benchmarks that are more than threshold worse than the baseline."""
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        new, old = result['value'], baseline[name]['value']
+        ratio = new / old if result['better'] == 'lower' else old / new
+        if ratio > 1 + threshold:
+            regressions.append((name, old, new, ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the snake engine, bots and renderer.')
+    parser.add_argument('--quick', action='store_true', help='skip the largest boards and measure for a shorter time')
+    parser.add_argument('--output', default='bench.json', help='where to save the results as JSON')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare against')
+    parser.add_argument('--save-baseline', default=None, help='also save the results as the new baseline here')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown that counts as a regression (0.2 = 20%%)')
+    parser.add_argument('--no-render', action='store_true', help='skip the rendering benchmarks')
+    args = parser.parse_args()
+
+    min_time = 0.05 if args.quick else 0.3
+    results = bench_engine(QUICK_BOARDS if args.quick else BOARDS, min_time)
+    if not args.no_render:
+        results.update(bench_render(QUICK_RENDER_BOARDS if args.quick else RENDER_BOARDS, min_time))
+    results.update(bench_games(5*min_time))
+
+    for name, result in results.items():
+        print(f'{name:<40}{result["value"]:>14.2f} {result["unit"]}')
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, ratio in regressions:
+            print(f'REGRESSION {name}: {old:.2f} -> {new:.2f} ({100*(ratio-1):.0f}% worse)')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {100*args.threshold:.0f}% against {args.baseline}.')
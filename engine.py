@@ -0,0 +1,628 @@
+'''
+Headless engine for the snake game.
+It owns the snake, the food, the death and the score logic and runs without
+pygame, without a wall clock and without keystrokes, so bots can be evaluated
+offline as fast as Python allows:
+
+    game = Game()
+    game.reset(seed=42)
+    while True:
+        state, ate, dead = game.step(player(game))
+        if dead:
+            break
+
+The App in snake_game.py is only a renderer and input layer on top of this.
+'''
+
+import threading
+import numpy as np
+from copy import copy
+from time import perf_counter
+from snake import Snake
+from observation import Observation
+from events import EventStream, BATCH_STEPS, GAME_RESET, TAIL_REMOVED, HEAD_MOVED, ATE, FOOD_SPAWNED, DIED, WON
+from zobrist import keys_for
+
+
+# directions and their compact codes, as used by replays and the batch environment
+DIRECTIONS = ('up', 'down', 'left', 'right')
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+
+class FreeCells:
+    """
+    The free cells of the board as a swap-remove array with a position map.
+    The first size entries of cells are the free ones, pos[cell] tells where a cell
+    sits in cells. Adding, removing and drawing a uniform free cell are all O(1).
+
+    Their order decides where food spawns. mark() remembers the current order in O(1),
+    so that snapshots of a game can rebuild exactly this index when they need it.
+    reset() brings back the order of a new index by undoing only the slots that changed.
+    """
+
+    def __init__(self, n_cells):
+        """Constructs the index with every cell free."""
+        self.cells = list(range(n_cells))
+        self.pos = list(range(n_cells))
+        self.size = n_cells
+
+        # the slots that cells were taken from and the lowest size since the last reset: no
+        # other slot has changed. None when unknown, e.g. for an index built from a body
+        self._touched = []
+        self._low = n_cells
+
+        # the swaps made since the first mark, guarded against marks restored in other threads
+        self._log = None
+        self._lock = None
+
+    @classmethod
+    def from_body(cls, n_cells, body):
+        """Builds the index of a board whose taken cells are body, a list of flat cells. Costs O(cells)."""
+
+        occupied = np.zeros(n_cells, dtype=bool)
+        occupied[body] = True
+        order = np.concatenate([np.flatnonzero(~occupied), np.flatnonzero(occupied)])
+        pos = np.empty_like(order)
+        pos[order] = np.arange(len(order))
+
+        free_cells = cls.__new__(cls)
+        free_cells.cells = order.tolist()
+        free_cells.pos = pos.tolist()
+        free_cells.size = n_cells - len(body)
+        free_cells._touched = free_cells._low = None
+        free_cells._log = free_cells._lock = None
+        return free_cells
+
+    def copy(self):
+        """Returns an independent copy of the index. Costs O(cells)."""
+
+        new = FreeCells.__new__(FreeCells)
+        new.cells = self.cells[:]
+        new.pos = self.pos[:]
+        new.size = self.size
+        new._touched = None if self._touched is None else self._touched[:]
+        new._low = self._low
+        new._log = new._lock = None
+        return new
+
+    def mark(self):
+        """
+        Returns a FreeCellsMark of the current state in O(1). From now on, the index logs
+        its swaps so that the mark can undo them. Once the log is as long as the board,
+        the index moves on to fresh lists and stops logging until the next mark.
+        """
+
+        if self._log is None:
+            self._log = []
+            self._lock = threading.Lock()
+        return FreeCellsMark(self.cells, self.pos, self.size, self._log, self._lock)
+
+    def reset(self):
+        """
+        Frees every cell again, in the order of a new index. Costs O(cells taken since the last
+        reset) instead of the O(cells) of a new index, unless the order was unknown or the
+        index has taken more cells than the board has since then.
+        """
+
+        n_cells = len(self.cells)
+        touched = self._touched
+        if touched is None:
+            self.cells = list(range(n_cells))
+            self.pos = list(range(n_cells))
+        else:
+            if self._log is not None:
+                # the marks keep these lists
+                self.cells, self.pos = self.cells[:], self.pos[:]
+            cells, pos = self.cells, self.pos
+            for slot in touched:
+                cells[slot] = pos[slot] = slot
+            for slot in range(self._low, n_cells):
+                cells[slot] = pos[slot] = slot
+        self.size = n_cells
+        self._touched = []
+        self._low = n_cells
+        self._log = self._lock = None
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, cell):
+        return self.pos[cell] < self.size
+
+    def _swap(self, i, j):
+        cells, pos = self.cells, self.pos
+        a, b = cells[i], cells[j]
+        log = self._log
+        if log is None:
+            cells[i], cells[j] = b, a
+            pos[a], pos[b] = j, i
+            return
+
+        with self._lock:
+            cells[i], cells[j] = b, a
+            pos[a], pos[b] = j, i
+            log.append(i)
+            log.append(j)
+        if len(log) >= 2*len(cells):
+            # the marks keep these lists, which are not changed any more
+            self.cells, self.pos = cells[:], pos[:]
+            self._log = self._lock = None
+
+    def remove(self, cell):
+        """Marks a free cell as taken by moving it just behind the free part."""
+        self.size -= 1
+        slot = self.pos[cell]
+        touched = self._touched
+        if touched is not None:
+            # add() only swaps slots at or behind the lowest size, which reset() undoes anyway
+            touched.append(slot)
+            if self.size < self._low:
+                self._low = self.size
+            if len(touched) > len(self.cells):
+                self._touched = None
+        self._swap(slot, self.size)
+
+    def add(self, cell):
+        """Marks a taken cell as free by moving it to the end of the free part."""
+        self._swap(self.pos[cell], self.size)
+        self.size += 1
+
+    def sample(self, rng):
+        """Returns a uniformly drawn free cell."""
+        return self.cells[int(rng.integers(self.size))]
+
+
+class FreeCellsMark:
+    """The state of a FreeCells at the time of FreeCells.mark(), kept in O(1)."""
+
+    __slots__ = ('cells', 'pos', 'size', 'log', 'start', 'lock')
+
+    def __init__(self, cells, pos, size, log, lock):
+        self.cells = cells
+        self.pos = pos
+        self.size = size
+        self.log = log
+        self.start = len(log)
+        self.lock = lock
+
+    def restore(self):
+        """Returns a new FreeCells in the marked state, with the same order of cells.
+        Costs O(cells + swaps made since the mark)."""
+
+        with self.lock:
+            cells, pos, swaps = self.cells[:], self.pos[:], self.log[self.start:]
+
+        # a swap undoes itself: replay the swaps backwards
+        for k in range(len(swaps)-2, -1, -2):
+            i, j = swaps[k], swaps[k+1]
+            a, b = cells[i], cells[j]
+            cells[i], cells[j] = b, a
+            pos[a], pos[b] = j, i
+
+        free_cells = FreeCells.__new__(FreeCells)
+        free_cells.cells, free_cells.pos, free_cells.size = cells, pos, self.size
+        free_cells._touched = free_cells._low = None
+        free_cells._log = free_cells._lock = None
+        return free_cells
+
+
+class Game:
+    """A single game of snake that advances one step per call to step()."""
+
+    def __init__(self, grid_size=(400, 400), cell_size=10, margin_left=10, margin_top=90, seed=None):
+        """
+        Constructs the game. Positions are given in pixels, exactly like in the
+        windowed App, so that bots see the same coordinates in both cases.
+        """
+        self._init_board(grid_size, cell_size, margin_left, margin_top)
+
+        # Start the first game
+        self.reset(seed)
+
+    def _init_board(self, grid_size, cell_size, margin_left, margin_top):
+        """Sets the geometry of the board and switches the optional extras off."""
+
+        # Initialize board geometry
+        self.grid_size = self.xdim, self.ydim = grid_size
+        self.cell_size = cell_size
+        self.margin_left = margin_left
+        self.margin_top = margin_top
+        self.n_cols = self.xdim // cell_size
+        self.n_rows = self.ydim // cell_size
+        self._keys = keys_for(self.n_cols * self.n_rows)
+
+        # The free cell index and the random number generator, built on first use by the
+        # properties free_cells and rng where a game starts without them (see snapshot)
+        self._free_cells = self._free_cells_mark = None
+        self._rng = None
+
+        # Set a profiler.Profiler here to time the phases of every step
+        self.profiler = None
+
+        # NumPy observation for learning bots, kept up to date once observe() is called
+        self.observation = None
+
+        # Stream of events for subscribers (see events.py), created by subscribe()
+        self.events = None
+
+    def reset(self, seed=None):
+        """
+        Starts a new game. The same seed always yields the same game. Without a seed,
+        a fresh one is drawn and stored in game.seed, so every game can be replayed.
+        """
+
+        # Every game has its own random number generator
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy) % 2**64
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+        # The direction the snake took in every step, one code per byte (see replay.py)
+        self.directions_taken = bytearray()
+
+        # Free every cell in the order of a new index: its order decides where food spawns,
+        # so it must not depend on the previous game
+        free_cells = self._free_cells
+        if free_cells is None:
+            free_cells = FreeCells(self.n_cols * self.n_rows)
+        else:
+            free_cells.reset()
+        self.free_cells = free_cells
+
+        # Create and place snake
+        direction = DIRECTIONS[self.rng.integers(4)]
+        self.snake = Snake(*self._random_cell(), direction=direction, cell_size=self.cell_size)
+        self._head_cell = self.cell_index(self.snake.body[-1])
+        self.free_cells.remove(self._head_cell)
+        self._zobrist = self._keys.hash([self._head_cell])
+        self._food_cell = None
+        self.score = {'food_eaten':0, 'mean steps per food':' '}
+        self.will_die = False
+        self.won = False
+        self.done = False
+        self.iteration = 1
+        self.mean_steps_per_food = '-'
+
+        if self.events is not None:
+            self.events.pending.append((GAME_RESET, 1, self._head_cell))
+
+        # Create and place food
+        self._place_food()
+
+        if self.observation is not None:
+            self.observation.reset()
+
+        return self
+
+    @classmethod
+    def from_cells(cls, n_cols, n_rows, body, direction, food=None, iteration=1, cell_size=1,
+                   margin_left=0, margin_top=0):
+        """
+        Builds a game in a given state, e.g. one of a BatchGame or one received from another
+        process. body is the list of the flat cells of the snake, tail first and head last,
+        food the flat cell of the food or None. Positions are in cells by default (cell size 1,
+        no margins). The food placed from then on does not follow any seed. Costs O(length):
+        the game builds its free cell index and random number generator only when it needs them.
+        """
+
+        body = [int(cell) for cell in body]
+        game = cls.__new__(cls)
+        game._init_board((n_cols*cell_size, n_rows*cell_size), cell_size, margin_left, margin_top)
+        game.seed = 0
+        game.directions_taken = bytearray()
+        game.snake = Snake(direction=direction, cell_size=cell_size)
+        game.snake.body = [game.cell_position(cell) for cell in body]
+
+        game.food_pos = None if food is None else game.cell_position(food)
+        game.iteration = iteration
+        game.score = {'food_eaten': len(body)-1, 'mean steps per food': ' '}
+        game.mean_steps_per_food = '-'
+        game.will_die = game.won = game.done = False
+        game.rehash()
+        return game
+
+    def _random_cell(self):
+        """Returns the pixel position of a uniformly drawn cell of the grid."""
+        return [self.margin_left + self.cell_size*int(self.rng.integers(self.n_cols)),
+                self.margin_top + self.cell_size*int(self.rng.integers(self.n_rows))]
+
+    def cell_index(self, pos):
+        """Converts a pixel position [xpos,ypos] into the flat index of its cell."""
+        return ((pos[1]-self.margin_top)//self.cell_size)*self.n_cols + (pos[0]-self.margin_left)//self.cell_size
+
+    def cell_position(self, index):
+        """Converts the flat index of a cell into its pixel position [xpos,ypos]."""
+        row, col = divmod(index, self.n_cols)
+        return [self.margin_left + col*self.cell_size, self.margin_top + row*self.cell_size]
+
+    def observe(self, body_age=False):
+        """Returns the Observation of the game (see observation.py), creating it on the first
+        call. From then on, every step and reset updates it in place."""
+
+        if self.observation is None or self.observation.body_age != body_age:
+            self.observation = Observation(self, body_age)
+        return self.observation
+
+    def subscribe(self, callback, batch_steps=None):
+        """
+        Calls callback(events) with the events of the game from now on (see events.py).
+        Right away, callback gets the current state: a game_reset of the tail cell, a
+        head_moved for every further body cell and the food (and died or won if the game
+        is over). batch_steps asks for the events of at most this many steps at once; the
+        stream delivers as often as its most demanding subscriber asks. Returns the EventStream.
+        """
+
+        if self.events is None:
+            self.events = EventStream(batch_steps or BATCH_STEPS)
+        elif batch_steps is not None:
+            self.events.batch_steps = min(self.events.batch_steps, batch_steps)
+
+        # the pending events are already part of the state the new subscriber starts from
+        self.events.flush()
+        it = self.iteration
+        body = [self.cell_index(pos) for pos in self.snake.body]
+        state = [(GAME_RESET, it, body[0])] + [(HEAD_MOVED, it, cell) for cell in body[1:]]
+        if self._food_cell is not None:
+            state.append((FOOD_SPAWNED, it, self._food_cell))
+        if self.done:
+            state.append((WON if self.won else DIED, it, self._head_cell))
+        callback(state)
+
+        self.events.subscribe(callback)
+        return self.events
+
+    @property
+    def zobrist(self):
+        """64 bit Zobrist hash of the state: body, head, tail, food and direction (see zobrist.py)."""
+        return self._zobrist ^ self._keys.direction[DIRECTION_CODES[self.snake.current_direction]]
+
+    def rehash(self):
+        """Recomputes the Zobrist hash from scratch, after the snake or the food were changed by hand."""
+        body = [self.cell_index(pos) for pos in self.snake.body]
+        self._head_cell = body[-1]
+        self._food_cell = None if self.food_pos is None else self.cell_index(self.food_pos)
+        self._zobrist = self._keys.hash(body, self._food_cell)
+
+    def _place_food(self):
+        """Place a food cell on a uniformly drawn free cell, so it never spawns on the snake.
+        Returns False, and removes the food, if the snake fills the whole board."""
+
+        if self._food_cell is not None:
+            self._zobrist ^= self._keys.food[self._food_cell]
+
+        free_cells = self.free_cells
+        if not free_cells:
+            self.food_pos = self._food_cell = None
+            return False
+
+        self._food_cell = free_cells.sample(self.rng)
+        self._zobrist ^= self._keys.food[self._food_cell]
+        self.food_pos = self.cell_position(self._food_cell)
+        if self.events is not None:
+            self.events.pending.append((FOOD_SPAWNED, self.iteration, self._food_cell))
+        if self.profiler is not None:
+            self.profiler.count('food_placements')
+        return True
+
+    def _check_will_eat(self, head=None):
+        """Returns True if the snake head will land on a food cell in the next step and
+        updates the mean steps per food."""
+
+        if head is None:
+            head = self.snake.next_head_position()
+
+        if head == self.food_pos:
+            self.mean_steps_per_food = round((self.iteration+1)/(self.score['food_eaten']+1),2)
+            return True
+
+        return False
+
+    def _check_death(self, snake=None):
+        """Returns True if the snake dies in the next iteration. Moving onto the current
+        tail cell is safe, because the tail moves away, unless the snake is about to eat."""
+
+        # Select which snake to check
+        if snake is not None:
+            if not isinstance(snake, Snake):
+                raise ValueError(f'snake needs to be Snake.snake, not {type(snake)}.')
+            snake_to_check = snake
+        else:
+            snake_to_check = self.snake
+
+        return self._is_fatal(snake_to_check, snake_to_check.next_head_position())
+
+    def _is_fatal(self, snake, head):
+        """Returns True if moving the head of snake onto head kills it."""
+
+        head_x, head_y = head
+
+        # Check death criteria
+        outside_bounds =  head_x >= self.grid_size[0]+self.margin_left or head_x < self.margin_left or \
+                          head_y >= self.grid_size[1]+self.margin_top or head_y < self.margin_top
+        eats_itself = snake.hits_itself(head, has_eaten=head == self.food_pos)
+        death = outside_bounds or eats_itself
+
+        return death
+
+    def _update_score(self):
+        """Counts the food the snake just ate."""
+        self.score['food_eaten'] += 1
+        self.score['mean steps per food'] = self.mean_steps_per_food
+
+    def copy(self):
+        """
+        Returns an independent copy of the game, e.g. to hand to a bot that runs in another
+        thread while this game moves on. Costs O(length + cells + steps), all plain copies.
+        """
+
+        new_game = copy(self)
+        new_game.snake = copy(self.snake)
+        new_game.snake.body = self.snake.body
+        new_game.score = dict(self.score)
+        new_game.free_cells = self.free_cells.copy()
+        new_game.rng = np.random.default_rng()
+        new_game.rng.bit_generator.state = self.rng.bit_generator.state
+        new_game.directions_taken = self.directions_taken[:]
+        new_game.profiler = new_game.events = None
+        if self.observation is not None:
+            new_game.observation = self.observation.copy(new_game)
+        return new_game
+
+    def snapshot(self, observation=True):
+        """
+        Returns a copy of the game for a bot to think about, in O(length) instead of the
+        O(cells) of copy(): the copy only marks the free cell index of this game and
+        rebuilds it, in the same order, if it needs one, e.g. when it places food. So the
+        copy places the same food as this game would. With observation=False, the copy has
+        no observation, which costs O(board) to copy.
+        """
+
+        new_game = copy(self)
+        if self._free_cells is not None:
+            new_game.free_cells = None
+            new_game._free_cells_mark = self._free_cells.mark()
+        new_game.snake = copy(self.snake)
+        new_game.snake.body = self.snake.body
+        new_game.score = dict(self.score)
+        if self._rng is not None:
+            new_game.rng = np.random.default_rng()
+            new_game.rng.bit_generator.state = self._rng.bit_generator.state
+        new_game.directions_taken = self.directions_taken[:]
+        new_game.profiler = new_game.events = None
+        new_game.observation = None
+        if observation and self.observation is not None:
+            new_game.observation = self.observation.copy(new_game)
+        return new_game
+
+    @property
+    def free_cells(self):
+        """The FreeCells index of the board. Snapshots restore it from the mark of their game,
+        games from from_cells build it from the body, both on first use."""
+
+        free_cells = self._free_cells
+        if free_cells is None:
+            if self._free_cells_mark is not None:
+                free_cells = self._free_cells_mark.restore()
+            else:
+                body = [self.cell_index(pos) for pos in self.snake.body]
+                free_cells = FreeCells.from_body(self.n_cols*self.n_rows, body)
+            self.free_cells = free_cells
+        return free_cells
+
+    @free_cells.setter
+    def free_cells(self, free_cells):
+        self._free_cells = free_cells
+        self._free_cells_mark = None
+
+    @property
+    def rng(self):
+        """The random number generator of the game, created from the seed on first use."""
+        if self._rng is None:
+            self._rng = np.random.default_rng(self.seed)
+        return self._rng
+
+    @rng.setter
+    def rng(self, rng):
+        self._rng = rng
+
+    def change_direction(self, action):
+        """Applies an action ('up', 'down', 'left', 'right' or None) to the snake."""
+        if action is not None:
+            self.snake.change_direction(action)
+
+    def step(self, action=None):
+        """
+        Advances the game by one step. This consists of 3 steps.
+            Step 1. Apply the action to the snake (None keeps the current direction).
+            Step 2. Check whether the snake dies. If it does, the game is over.
+            Step 3. Move the snake, growing it and placing new food if it eats.
+        Returns a tuple (state, ate, dead), where state is the game itself.
+        If the snake fills the whole board, the game is won: game.won and game.done are set.
+        """
+
+        if self.done:
+            raise RuntimeError('The game is over. Call reset() to start a new one.')
+
+        profiler = self.profiler
+        if profiler is not None:
+            t0 = perf_counter()
+
+        # Step 1
+        self.change_direction(action)
+        self.directions_taken.append(DIRECTION_CODES[self.snake.current_direction])
+
+        # Step 2
+        snake = self.snake
+        head = snake.next_head_position()
+        self.iteration += 1
+        self.will_die = self._is_fatal(snake, head)
+        if profiler is not None:
+            t1 = perf_counter()
+            profiler.record('death_check', t1 - t0)
+            profiler.count('steps')
+        if self.will_die:
+            self.done = True
+            if self.events is not None:
+                self.events.pending.append((DIED, self.iteration, self._head_cell))
+                self.events.flush()
+            return self, False, True
+
+        # Step 3
+        ate = self._check_will_eat(head)
+        if profiler is not None:
+            t2 = perf_counter()
+            profiler.record('food_check', t2 - t1)
+        tail_cell = None if ate else self.cell_index(snake.body[0])
+        head_cell = self.cell_index(head)
+        keys = self._keys
+        self._zobrist ^= keys.head[self._head_cell] ^ keys.head[head_cell] ^ keys.body[head_cell]
+        self._head_cell = head_cell
+        free_cells = self.free_cells
+        if not ate:
+            free_cells.add(tail_cell)
+        snake.move(has_eaten=ate, new_head_cell=head)
+        free_cells.remove(head_cell)
+        if not ate:
+            self._zobrist ^= keys.body[tail_cell] ^ keys.tail[tail_cell] ^ keys.tail[self.cell_index(snake.body[0])]
+        if profiler is not None:
+            t3 = perf_counter()
+            profiler.record('move', t3 - t2)
+        events = self.events
+        if events is not None:
+            pending = events.pending
+            if not ate:
+                pending.append((TAIL_REMOVED, self.iteration, tail_cell))
+            pending.append((HEAD_MOVED, self.iteration, head_cell))
+            if ate:
+                pending.append((ATE, self.iteration, head_cell))
+        if ate:
+            self._update_score()
+            if not self._place_food():
+                self.won = self.done = True
+            if profiler is not None:
+                profiler.record('food_placement', perf_counter() - t3)
+        if self.observation is not None:
+            self.observation.move(head_cell, tail_cell)
+        if events is not None:
+            if self.won:
+                events.pending.append((WON, self.iteration, head_cell))
+                events.flush()
+            else:
+                events.end_step()
+
+        return self, ate, False
+
+    def play(self, player, max_steps=None):
+        """Plays a whole game with the given player and returns the final score."""
+
+        if getattr(player, 'observation', False):
+            self.observe(body_age=player.observation == 'body_age')
+
+        while max_steps is None or self.iteration <= max_steps:
+            self.step(player(self))
+            if self.done:
+                break
+
+        if self.events is not None:
+            self.events.flush()
+        return self.score
@@ -0,0 +1,127 @@
+'''
+A stream of game events with compact delta payloads.
+
+Instead of reading the whole game every step and working out what changed,
+subscribers are told what changed:
+
+    def on_events(events):
+        for kind, iteration, cell in events:
+            ...
+    game.subscribe(on_events)
+
+Every event is a tuple (kind, iteration, cell), with cell a flat index,
+row*n_cols + column:
+
+    game_reset      a new game started, cell is the head of the new snake
+    tail_removed    the tail left cell (not when the snake eats)
+    head_moved      the head entered cell
+    ate             the snake ate the food in cell
+    food_spawned    food appeared in cell
+    died            the snake died, cell is its head
+    won             the snake fills the board, cell is its head
+
+Within a step, tail_removed comes before head_moved, so a set of body cells
+stays correct when the head enters the cell the tail just left. Keeping a
+copy of the snake in sync costs O(1) per event, see BodyTracker.
+
+A subscriber that joins a game in progress first gets the current state in
+the same terms: a game_reset of the tail cell, a head_moved for every further
+body cell, food_spawned, and died or won if the game is already over.
+
+Events are delivered in batches, as lists of tuples: by default all events
+of batch_steps steps at once, and at the latest when a game ends or play()
+returns. Headless games keep the default to call subscribers rarely, the
+window wants them every step (the smallest batch_steps asked for wins):
+
+    game.subscribe(on_events, batch_steps=1)
+'''
+
+from collections import deque
+
+
+GAME_RESET = 'game_reset'
+TAIL_REMOVED = 'tail_removed'
+HEAD_MOVED = 'head_moved'
+ATE = 'ate'
+FOOD_SPAWNED = 'food_spawned'
+DIED = 'died'
+WON = 'won'
+EVENTS = (GAME_RESET, TAIL_REMOVED, HEAD_MOVED, ATE, FOOD_SPAWNED, DIED, WON)
+
+# steps whose events are delivered together, unless a subscriber asks for fewer
+BATCH_STEPS = 64
+
+
+class EventStream:
+    """Collects the events of a Game and hands them to its subscribers in batches."""
+
+    def __init__(self, batch_steps=BATCH_STEPS):
+        self.batch_steps = batch_steps
+        self.subscribers = []
+        self.pending = []
+        self._steps = 0
+
+    def subscribe(self, callback):
+        """Calls callback(events) with every batch of events from now on. Returns callback."""
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def end_step(self):
+        """Called by Game.step after it added the events of a step. Delivers them once
+        batch_steps steps are collected."""
+
+        self._steps += 1
+        if self._steps >= self.batch_steps:
+            self.flush()
+
+    def flush(self):
+        """Delivers the pending events. All subscribers get the same list, which they must not change."""
+
+        self._steps = 0
+        if not self.pending:
+            return
+        events, self.pending = self.pending, []
+        for callback in self.subscribers:
+            callback(events)
+
+
+class BodyTracker:
+    """
+    A subscriber that keeps the cells of the snake, the food and the score up to date
+    from the events alone, in O(1) per event. An example for bots with incremental state.
+    """
+
+    def __init__(self):
+        self.body = deque()      # flat cells, tail first and head last
+        self.occupied = set()
+        self.food = None
+        self.iteration = 0
+        self.alive = False
+
+    @property
+    def food_eaten(self):
+        # the snake grows by one cell per food
+        return max(len(self.body) - 1, 0)
+
+    def __call__(self, events):
+        for kind, iteration, cell in events:
+            self.iteration = iteration
+            if kind == HEAD_MOVED:
+                self.body.append(cell)
+                self.occupied.add(cell)
+            elif kind == TAIL_REMOVED:
+                self.occupied.discard(self.body.popleft())
+            elif kind == ATE:
+                self.food = None
+            elif kind == FOOD_SPAWNED:
+                self.food = cell
+            elif kind == GAME_RESET:
+                self.body = deque([cell])
+                self.occupied = {cell}
+                self.food = None
+                self.alive = True
+            else:
+                self.alive = False
@@ -0,0 +1,321 @@
+'''
+Genetic algorithm that trains snake bots.
+
+GeneticPlayer is a bot whose decisions come from a small neural network. The
+flat weight vector of that network is its genome. GeneticTrainer evolves a
+population of genomes with selection, crossover and mutation. Fitness is
+measured in headless games: all games of a generation run in lockstep in one
+BatchGame (one per worker process), with a network per genome, and the elite
+genome of every generation is saved as a checkpoint.
+
+$ python genetic.py --generations 50 --population 100 --board 40 40
+'''
+
+import argparse
+import multiprocessing as mp
+import os
+from time import perf_counter
+
+import numpy as np
+
+from batch_env import BatchGame, DX, DY, OPPOSITE
+from engine import DIRECTIONS
+from player import BasePlayer
+
+
+class GeneticPlayer(BasePlayer):
+    """
+    A bot that scores each direction with the same small network and picks the best one.
+    The network sees 5 features per direction:
+        danger       1 if moving there kills the snake
+        closer       +1 if the distance to the food shrinks, -1 if it grows
+        opposite     1 if the direction is opposite to the current one
+        free ahead   number of free cells in a straight line, divided by the board size
+        bias         always 1
+    """
+
+    n_features = 5
+    n_hidden = 8
+    genome_size = n_features*n_hidden + n_hidden + n_hidden + 1
+
+    def __init__(self, genome=None):
+        """Constructs the player. Without a genome, random weights are used."""
+        super().__init__()
+        self.bot_name = 'genetic'
+
+        if genome is None:
+            genome = np.random.normal(0, 1, self.genome_size)
+        self.set_genome(genome)
+
+    def set_genome(self, genome):
+        """Unpacks the flat genome into the weights of the network."""
+
+        genome = np.asarray(genome, dtype=float)
+        if genome.shape != (self.genome_size,):
+            raise ValueError(f'Genome must have shape ({self.genome_size},), not {genome.shape}.')
+
+        self.genome = genome
+        n_f, n_h = self.n_features, self.n_hidden
+        self.w1 = genome[:n_f*n_h].reshape(n_f, n_h)
+        self.b1 = genome[n_f*n_h:n_f*n_h+n_h]
+        self.w2 = genome[n_f*n_h+n_h:n_f*n_h+2*n_h]
+        self.b2 = genome[-1]
+
+    def features(self, App):
+        """Returns the features of the 4 directions as a (4, n_features) array."""
+
+        snake = App.snake
+        head_x, head_y = snake.body[-1]
+        food_x, food_y = App.food_pos if App.food_pos is not None else (head_x, head_y)
+        cs = snake.cell_size
+        x_min, y_min = App.margin_left, App.margin_top
+        x_max, y_max = x_min + App.grid_size[0], y_min + App.grid_size[1]
+        board_size = max(App.grid_size) // cs
+        distance = abs(food_x-head_x) + abs(food_y-head_y)
+        opposite = snake.directions[snake.current_direction]
+
+        features = np.ones((4, self.n_features))
+        for i, (direction, dx, dy) in enumerate(zip(DIRECTIONS, DX.tolist(), DY.tolist())):
+            new_x, new_y = head_x + dx*cs, head_y + dy*cs
+
+            # count free cells in a straight line
+            free = 0
+            x, y = new_x, new_y
+            while x_min <= x < x_max and y_min <= y < y_max and not snake.occupies((x, y)):
+                free += 1
+                x += dx*cs
+                y += dy*cs
+
+            features[i, 0] = App._check_death(snake=snake.change_direction(direction, return_copy=True))
+            features[i, 1] = np.sign(distance - abs(food_x-new_x) - abs(food_y-new_y))
+            features[i, 2] = direction == opposite
+            features[i, 3] = free / board_size
+
+        return features
+
+    def my_bot(self, App):
+        """This bot moves in the direction its network rates highest."""
+
+        features = self.features(App)
+        scores = np.tanh(features @ self.w1 + self.b1) @ self.w2 + self.b2
+        scores[features[:, 2] == 1] = -np.inf
+        return DIRECTIONS[int(np.argmax(scores))]
+
+    def batch_features(self, games):
+        """Returns the features of the 4 directions of every game of a BatchGame as an
+        (N, 4, n_features) array, the same as features() computes for a single game."""
+
+        head_x, head_y = games.head_x[:, None], games.head_y[:, None]
+        food_x, food_y = games.food[:, None] % games.n_cols, games.food[:, None] // games.n_cols
+        new_x, new_y = head_x + DX, head_y + DY
+
+        features = np.ones((games.n_games, 4, self.n_features))
+        features[:, :, 0] = games.danger()
+        features[:, :, 1] = np.sign(abs(food_x-head_x) + abs(food_y-head_y) - abs(food_x-new_x) - abs(food_y-new_y))
+        features[:, :, 2] = np.arange(4) == OPPOSITE[games.direction][:, None]
+
+        # count free cells in a straight line: the distance to the first occupied cell in the
+        # head's row or column, or to the wall if there is none
+        occupied = games.occupied.reshape(games.n_games, games.n_rows, games.n_cols)
+        idx = np.arange(games.n_games)
+        column = occupied[idx, :, games.head_x]   # (N, n_rows)
+        row = occupied[idx, games.head_y, :]                        # (N, n_cols)
+        free = np.empty((games.n_games, 4))
+        for i, (line, position, length) in enumerate(((column, games.head_y, games.n_rows),
+                                                      (row, games.head_x, games.n_cols))):
+            cells = np.arange(length)
+            before = line & (cells < position[:, None])
+            after = line & (cells > position[:, None])
+            first_before = np.where(before.any(axis=1), length-1 - np.argmax(before[:, ::-1], axis=1), -1)
+            first_after = np.where(after.any(axis=1), np.argmax(after, axis=1), length)
+            free[:, 2*i] = position - first_before - 1
+            free[:, 2*i+1] = first_after - position - 1
+        features[:, :, 3] = free / max(games.n_cols, games.n_rows)
+
+        return features
+
+    def my_bot_batch(self, games):
+        """Decides for all games of a BatchGame with one pass of the network."""
+
+        features = self.batch_features(games)
+        scores = np.tanh(features @ self.w1 + self.b1) @ self.w2 + self.b2
+        scores[features[:, :, 2] == 1] = -np.inf
+        return np.argmax(scores, axis=1)
+
+
+# the arrays that make up the state of a game of a BatchGame, see evaluate_population
+_GAME_STATE = ('head_x', 'head_y', 'direction', 'body', 'tail', 'length', 'occupied', 'food')
+
+
+def evaluate_population(genomes, n_games, board_size=(40, 40), starvation=None, seed=None):
+    """
+    Plays n_games games with every genome and returns the fitness of every genome: the mean
+    food eaten plus a small bonus for surviving. A game ends early if the snake goes starvation
+    steps without eating (default: the number of cells of the board), so that bots running in
+    circles do not stall the evaluation. All games run in lockstep in one BatchGame, and one
+    pass of the networks of all genomes decides for all of them. Every genome starts its games
+    from the same n_games positions, drawn from seed; the food after that differs from game to game.
+    """
+
+    genomes = np.asarray(genomes, dtype=float)
+    n_genomes = len(genomes)
+    n_cols, n_rows = board_size
+    if starvation is None:
+        starvation = n_cols * n_rows
+
+    games = BatchGame(n_genomes*n_games, n_cols, n_rows, seed=seed)
+    starts = BatchGame(n_games, n_cols, n_rows, seed=seed)
+    same_start = np.tile(np.arange(n_games), n_genomes)
+    for name in _GAME_STATE:
+        getattr(games, name)[:] = getattr(starts, name)[same_start]
+
+    # the network of the genome that plays each game
+    bots = [GeneticPlayer(genome) for genome in genomes]
+    owner = np.repeat(np.arange(n_genomes), n_games)
+    w1 = np.stack([bot.w1 for bot in bots])[owner]
+    b1 = np.stack([bot.b1 for bot in bots])[owner]
+    w2 = np.stack([bot.w2 for bot in bots])[owner]
+    b2 = np.array([bot.b2 for bot in bots])[owner]
+
+    # a slot plays on after its game ended, but only its first game counts
+    food_eaten = np.zeros(games.n_games)
+    steps = np.zeros(games.n_games)
+    last_meal = np.ones(games.n_games, dtype=np.int64)
+    running = np.ones(games.n_games, dtype=bool)
+    while running.any():
+        features = bots[0].batch_features(games)
+        hidden = np.tanh(np.einsum('naf,nfh->nah', features, w1) + b1[:, None, :])
+        scores = np.einsum('nah,nh->na', hidden, w2) + b2[:, None]
+        scores[features[:, :, 2] == 1] = -np.inf
+        ate, done = games.step(np.argmax(scores, axis=1))
+
+        last_meal[ate] = games.iteration[ate]
+        ended = running & (done | (games.iteration - last_meal >= starvation))
+        food_eaten[ended] = np.where(done, games.final_food_eaten, games.food_eaten)[ended]
+        steps[ended] = np.where(done, games.final_steps, games.iteration - 1)[ended]
+        running &= ~ended
+
+    return ((food_eaten + 0.001*steps) / n_games).reshape(n_genomes, n_games).sum(axis=1)
+
+
+def _evaluate_genomes(task):
+    """Worker function: evaluates a chunk of genomes in one batch."""
+    genomes, n_games, board_size, starvation, seed = task
+    return evaluate_population(genomes, n_games, board_size, starvation, seed)
+
+
+class GeneticTrainer:
+    """Evolves a population of GeneticPlayer genomes."""
+
+    def __init__(self, population_size=100, n_elite=10, tournament_size=3, mutation_rate=0.1,
+                 mutation_scale=0.3, games_per_genome=5, board_size=(40, 40), starvation=None,
+                 processes=None, checkpoint_dir='checkpoints', seed=None):
+        """Constructs the trainer with a random initial population."""
+
+        self.population_size = population_size
+        self.n_elite = n_elite
+        self.tournament_size = tournament_size
+        self.mutation_rate = mutation_rate
+        self.mutation_scale = mutation_scale
+        self.games_per_genome = games_per_genome
+        self.board_size = tuple(board_size)
+        self.starvation = starvation
+        self.processes = processes
+        self.checkpoint_dir = checkpoint_dir
+
+        self.rng = np.random.default_rng(seed)
+        self.population = self.rng.normal(0, 1, (population_size, GeneticPlayer.genome_size))
+        self.fitness = None
+        self.generation = 0
+        self.history = []
+
+    def evaluate(self, pool=None):
+        """Computes the fitness of every genome. All genomes start from the same positions,
+        which change from generation to generation. Every worker plays its share of the
+        population in one batch."""
+
+        n_chunks = 1 if pool is None else (self.processes or os.cpu_count())
+        tasks = [(genomes, self.games_per_genome, self.board_size, self.starvation, self.generation)
+                 for genomes in np.array_split(self.population, n_chunks) if len(genomes)]
+        chunks = map(_evaluate_genomes, tasks) if pool is None else pool.map(_evaluate_genomes, tasks)
+        self.fitness = np.array([fitness for chunk in chunks for fitness in chunk])
+
+        return self.fitness
+
+    def _select(self):
+        """Tournament selection: returns the fittest of tournament_size random genomes."""
+        contestants = self.rng.integers(self.population_size, size=self.tournament_size)
+        return self.population[contestants[np.argmax(self.fitness[contestants])]]
+
+    def _crossover(self, mother, father):
+        """Uniform crossover: every gene comes from either parent with equal probability."""
+        return np.where(self.rng.random(mother.shape) < 0.5, mother, father)
+
+    def _mutate(self, genome):
+        """Adds gaussian noise to a random subset of the genes."""
+        mutate = self.rng.random(genome.shape) < self.mutation_rate
+        return genome + mutate * self.rng.normal(0, self.mutation_scale, genome.shape)
+
+    def next_generation(self):
+        """Replaces the population by the elite plus offspring of selected parents."""
+
+        ranking = np.argsort(self.fitness)[::-1]
+        elite = self.population[ranking[:self.n_elite]]
+        offspring = [self._mutate(self._crossover(self._select(), self._select()))
+                     for _ in range(self.population_size - self.n_elite)]
+
+        self.population = np.vstack([elite] + offspring)
+        self.generation += 1
+
+    def save_checkpoint(self):
+        """Saves the elite of the current generation and returns the file name."""
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = os.path.join(self.checkpoint_dir, f'generation_{self.generation:04d}.npz')
+        ranking = np.argsort(self.fitness)[::-1][:self.n_elite]
+        np.savez(path, genome=self.population[ranking[0]], elite=self.population[ranking],
+                 fitness=self.fitness[ranking], generation=self.generation)
+        return path
+
+    def train(self, n_generations, verbose=True):
+        """Runs the given number of generations and returns the best genome found."""
+
+        with mp.Pool(self.processes) as pool:
+            for _ in range(n_generations):
+                tstart = perf_counter()
+                self.evaluate(pool)
+                self.save_checkpoint()
+                self.history.append({'generation': self.generation,
+                                     'best': self.fitness.max(),
+                                     'mean': self.fitness.mean()})
+                if verbose:
+                    print(f'Generation {self.generation}: best fitness {self.fitness.max():.2f}, '
+                          f'mean fitness {self.fitness.mean():.2f} ({perf_counter()-tstart:.1f} s)')
+                best = self.population[np.argmax(self.fitness)]
+                self.next_generation()
+
+        return best
+
+
+def load_player(path):
+    """Creates a GeneticPlayer from the elite genome of a checkpoint."""
+    return GeneticPlayer(np.load(path)['genome'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train a snake bot with a genetic algorithm.')
+    parser.add_argument('--generations', type=int, default=50, help='number of generations')
+    parser.add_argument('--population', type=int, default=100, help='population size')
+    parser.add_argument('--elite', type=int, default=10, help='number of genomes kept unchanged')
+    parser.add_argument('--games', type=int, default=5, help='games per genome and generation')
+    parser.add_argument('--board', nargs=2, type=int, default=[40, 40], metavar=('COLUMNS', 'ROWS'),
+                        help='board size in cells')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--checkpoint-dir', default='checkpoints', help='where to save the elite genomes')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the genetic algorithm')
+    args = parser.parse_args()
+
+    trainer = GeneticTrainer(population_size=args.population, n_elite=args.elite, games_per_genome=args.games,
+                             board_size=args.board, processes=args.processes, checkpoint_dir=args.checkpoint_dir,
+                             seed=args.seed)
+    trainer.train(args.generations)
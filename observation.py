@@ -0,0 +1,156 @@
+'''
+NumPy observations of a game for learning-based bots.
+
+Instead of rebuilding their input from App.snake.body and the pixel positions
+every step, bots can read an Observation that the engine keeps up to date:
+
+    obs = game.observe()        # once; it follows the game from now on
+    obs.planes                  # (planes, n_rows, n_cols) float32, see PLANES
+    obs.features                # float32 vector, see FEATURES
+
+The planes are indexed by cell (row, column), not by pixel. Both arrays live in
+preallocated buffers that the engine changes in place on every step, touching
+only the cells that changed, so an observation costs O(1) per step instead of
+O(board). They are handed out as read-only views: copy them to keep a step.
+
+A player that sets observation = True (or 'body_age') gets one attached to the
+games it plays through Game.play, the App and the tournament.
+'''
+
+import numpy as np
+
+
+# planes: the snake's body (head included), its head, the food, the cells along the
+# walls and, optionally, the step at which the body entered each cell (0 where there
+# is no body). The age of a body cell is game.iteration minus that step.
+PLANES = ('body', 'head', 'food', 'walls', 'body_age')
+
+# features: whether moving up, down, left or right kills the snake, whether the food
+# lies up, down, left or right of the head, and the length as a fraction of the board
+FEATURES = ('danger_up', 'danger_down', 'danger_left', 'danger_right',
+            'food_up', 'food_down', 'food_left', 'food_right', 'length')
+
+BODY, HEAD, FOOD, WALLS, BODY_AGE = range(len(PLANES))
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class Observation:
+    """Cell planes and a feature vector of a Game, updated in place on every step."""
+
+    def __init__(self, game, body_age=False):
+        """Builds the observation of the current state of game. Costs O(board) once."""
+
+        self.game = game
+        self.body_age = body_age
+        n_planes = len(PLANES) if body_age else len(PLANES)-1
+        self._planes = np.zeros((n_planes, game.n_rows, game.n_cols), dtype=np.float32)
+        self._flat = self._planes.reshape(n_planes, -1)
+        self._features = np.zeros(len(FEATURES), dtype=np.float32)
+
+        self.planes = _read_only(self._planes)
+        self.features = _read_only(self._features)
+
+        self.reset()
+
+    def reset(self):
+        """Rebuilds the observation from the game, e.g. after a reset or after the game
+        was changed by hand. Costs O(board)."""
+
+        game = self.game
+        self._planes[:] = 0
+
+        walls = self._planes[WALLS]
+        walls[0, :] = walls[-1, :] = walls[:, 0] = walls[:, -1] = 1
+
+        body = [game.cell_index(pos) for pos in game.snake.body]
+        self._flat[BODY, body] = 1
+        if self.body_age:
+            # the head entered its cell in the last step that moved the snake (a fatal step does not)
+            entered = game.iteration - game.will_die
+            self._flat[BODY_AGE, body] = np.arange(entered-len(body)+1, entered+1)
+        self._head = body[-1]
+        self._flat[HEAD, self._head] = 1
+
+        self._food = None if game.food_pos is None else game.cell_index(game.food_pos)
+        if self._food is not None:
+            self._flat[FOOD, self._food] = 1
+
+        self._update_features()
+
+    def move(self, head, tail=None):
+        """
+        Called by Game.step after the snake moved: its head entered the cell head and,
+        unless it ate, its tail left the cell tail. Cells are flat indices. Costs O(1).
+        """
+
+        flat = self._flat
+        if tail is not None:
+            flat[BODY, tail] = 0
+            if self.body_age:
+                flat[BODY_AGE, tail] = 0
+
+        flat[HEAD, self._head] = 0
+        flat[BODY, head] = flat[HEAD, head] = 1
+        if self.body_age:
+            flat[BODY_AGE, head] = self.game.iteration
+        self._head = head
+
+        # the food moves when it is eaten
+        food_pos = self.game.food_pos
+        food = None if food_pos is None else self.game.cell_index(food_pos)
+        if food != self._food:
+            if self._food is not None:
+                flat[FOOD, self._food] = 0
+            if food is not None:
+                flat[FOOD, food] = 1
+            self._food = food
+
+        self._update_features()
+
+    def _update_features(self):
+        """Recomputes the feature vector from the cells around the head. Costs O(1)."""
+
+        game = self.game
+        n_cols, n_rows = game.n_cols, game.n_rows
+        row, col = divmod(self._head, n_cols)
+        free_cells = game.free_cells
+        tail = game.cell_index(game.snake.body[0])
+        food = self._food
+
+        # the same rules as Game._is_fatal: the tail cell is safe unless the snake eats there
+        danger = []
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+            r, c = row + dy, col + dx
+            if not (0 <= r < n_rows and 0 <= c < n_cols):
+                danger.append(1)
+                continue
+            cell = r*n_cols + c
+            danger.append(cell not in free_cells and (cell != tail or cell == food))
+
+        if food is None:
+            food_direction = (0, 0, 0, 0)
+        else:
+            food_row, food_col = divmod(food, n_cols)
+            food_direction = (food_row < row, food_row > row, food_col < col, food_col > col)
+
+        self._features[:] = (*danger, *food_direction, len(game.snake.body) / (n_cols*n_rows))
+
+    def copy(self, game):
+        """Returns a copy of the observation that follows game, a copy of this one's game."""
+
+        new = Observation.__new__(Observation)
+        new.game = game
+        new.body_age = self.body_age
+        new._planes = self._planes.copy()
+        new._flat = new._planes.reshape(len(new._planes), -1)
+        new._features = self._features.copy()
+        new.planes = _read_only(new._planes)
+        new.features = _read_only(new._features)
+        new._head = self._head
+        new._food = self._food
+        return new
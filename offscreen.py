@@ -0,0 +1,271 @@
+'''
+Offscreen rendering of recorded games to image sequences.
+
+FrameRenderer draws a game the way the window does (title, score, player name,
+white border, white body, red head, green food) onto an in-memory surface, so
+frames can be made without a window and as fast as the engine replays them.
+The App draws its window with the same functions (draw_header, draw_board):
+
+    renderer = FrameRenderer.for_game(game, bot_name='simpleBot', crop='board')
+    frame = renderer.to_array(game)          # (height, width, 3) uint8
+
+render_replays replays many games in a process pool and writes every n-th step
+of each as a PNG sequence, or all frames of a game as one packed array file:
+
+$ python offscreen.py replays/*.replay --out frames --every 10
+$ python offscreen.py replays/*.replay --out frames --format npz --crop board
+'''
+
+import argparse
+import multiprocessing as mp
+import os
+import zipfile
+
+import numpy as np
+import pygame
+
+import replay
+
+
+# the colors of the window
+BLACK, WHITE, RED, GREEN = (0,0,0), (255,255,255), (255,0,0), (0,255,0)
+
+# The layout of the window. The App draws with the same functions as FrameRenderer,
+# so that offscreen frames look exactly like the window.
+TITLE_TOP = 10
+SCORE_TOP, SCORE_LINE = 50, 20
+PLAYER_LEFT, PLAYER_BOTTOM, BEST_BOTTOM = 210, 85, 65
+MIN_WINDOW_WIDTH = 420
+
+
+def window_size(view_size, margin_left=10, margin_top=90, margin=10):
+    """Returns the size of the window for a board drawn at view_size pixels: room for the
+    title and the score above the board and a margin on the other sides."""
+    return max(view_size[0] + margin_left + margin, MIN_WINDOW_WIDTH), view_size[1] + margin_top + margin
+
+
+class HeaderTexts:
+    """The fonts of the header and its texts, rendered once. Needs pygame.font."""
+
+    def __init__(self, bot_name=None):
+        pygame.font.init()
+        self.title = pygame.font.Font('freesansbold.ttf', 32).render('Le Serpent', True, GREEN)
+        self.score_font = pygame.font.Font('freesansbold.ttf', 14)
+        self.player_font = pygame.font.Font('freesansbold.ttf', 12)
+        self.player = None
+        if bot_name is not None:
+            self.player = self.player_font.render(f'Player: {bot_name}'[:40], True, RED)
+        self._scores = {}
+
+    def score(self, score_str):
+        """Returns the rendered score line, kept until many different ones were asked for."""
+
+        text = self._scores.get(score_str)
+        if text is None:
+            if len(self._scores) > 1000:
+                self._scores.clear()
+            text = self._scores[score_str] = self.score_font.render(score_str, True, WHITE)
+        return text
+
+
+def score_lines(score):
+    """Returns the lines of the score display of a Game.score."""
+    return f'Food eaten: {score["food_eaten"]}', f'Mean steps per food:  {score["mean steps per food"]}'
+
+
+def draw_score(surface, texts, score, margin_left=10):
+    """Clears the score display and draws the score. Returns the rect it covers."""
+
+    rect = surface.fill(BLACK, (margin_left, SCORE_TOP, PLAYER_LEFT-margin_left, 2*SCORE_LINE))
+    for idx, score_str in enumerate(score_lines(score)):
+        surface.blit(texts.score(score_str), (margin_left, SCORE_TOP + idx*SCORE_LINE))
+    return rect
+
+
+def draw_header(surface, texts, score, margin_left=10, best_score=None):
+    """Clears the surface and draws the title, the score, the player name and the best score."""
+
+    surface.fill(BLACK)
+    surface.blit(texts.title, (margin_left, TITLE_TOP))
+    draw_score(surface, texts, score, margin_left)
+
+    if texts.player is not None:
+        player_rect = texts.player.get_rect()
+        player_rect.bottomleft = (PLAYER_LEFT, PLAYER_BOTTOM)
+        surface.blit(texts.player, player_rect)
+
+    if best_score is not None:
+        best_text = texts.player_font.render(f'Best: {best_score} food', True, RED)
+        best_rect = best_text.get_rect()
+        best_rect.bottomleft = (PLAYER_LEFT, BEST_BOTTOM)
+        surface.blit(best_text, best_rect)
+
+
+def draw_board(surface, grid_rect, game):
+    """Draws the border of the board at grid_rect, the food, the body in white and the head in red."""
+
+    pygame.draw.rect(surface, WHITE, grid_rect, 2)
+    cs = game.cell_size
+    if game.food_pos is not None:
+        surface.fill(GREEN, (*game.food_pos, cs, cs))
+    for cell in game.snake.body:
+        surface.fill(WHITE, (cell[0], cell[1], cs, cs))
+    surface.fill(RED, (*game.snake.body[-1], cs, cs))
+
+
+class FrameRenderer:
+    """Draws the state of a Game onto an offscreen surface, exactly like the window of the App."""
+
+    def __init__(self, grid_size=(400, 400), cell_size=10, margin_left=10, margin_top=90, bot_name=None,
+                 crop=None):
+        """
+        Renders frames of the size of the App's window for a board of grid_size pixels.
+        The player name is drawn if bot_name is given. crop is None for the whole window,
+        'board' for the board and its border, or a rect (x, y, width, height) in pixels.
+        """
+
+        self.margin_left = margin_left
+        self.grid_rect = pygame.Rect(margin_left, margin_top, *grid_size)
+        self.window_size = window_size(grid_size, margin_left, margin_top)
+        self.surface = pygame.Surface(self.window_size, depth=24)
+        self.texts = HeaderTexts(bot_name)
+
+        if crop is None:
+            crop = ((0, 0), self.window_size)
+        elif crop == 'board':
+            crop = self.grid_rect
+        self.crop = pygame.Rect(crop).clip(self.surface.get_rect())
+        self._frame = self.surface.subsurface(self.crop)
+
+    @classmethod
+    def for_game(cls, game, bot_name=None, crop=None):
+        """Returns a renderer for the board of game (a Game or a replay.Replay)."""
+        return cls(game.grid_size, game.cell_size, game.margin_left, game.margin_top, bot_name, crop)
+
+    def render(self, game):
+        """Draws the current state of game and returns the (cropped) frame as a Surface.
+        The surface is reused by the next call, copy it to keep it."""
+
+        draw_header(self.surface, self.texts, game.score, self.margin_left)
+        draw_board(self.surface, self.grid_rect, game)
+        return self._frame
+
+    def to_array(self, game):
+        """Draws the current state of game and returns the frame as a (height, width, 3) uint8 array."""
+
+        frame = self.render(game)
+        return np.frombuffer(pygame.image.tobytes(frame, 'RGB'), dtype=np.uint8).reshape(frame.get_height(),
+                                                                                        frame.get_width(), 3)
+
+
+def frame_steps(n_steps, every=1):
+    """Returns the steps iter_frames renders of a replay of n_steps steps."""
+    return sorted(set(range(0, n_steps, every)) | {n_steps})
+
+
+def iter_frames(game_replay, every=1, bot_name=None, crop=None):
+    """
+    Replays a replay.Replay (or the path of a replay file) and yields (step, frame array)
+    for step 0, every n-th step after it and the last step.
+    """
+
+    replayer = replay.Replayer(game_replay)
+    renderer = FrameRenderer.for_game(replayer.replay, bot_name, crop)
+
+    yield 0, renderer.to_array(replayer.game)
+    while not replayer.finished:
+        replayer.advance(every)
+        yield replayer.position, renderer.to_array(replayer.game)
+
+
+def render_replay(path, out_dir, fmt='png', every=1, bot_name=None, crop=None):
+    """
+    Renders the replay file at path into out_dir: as out_dir/<name>/<step>.png for fmt 'png', or
+    as out_dir/<name>.npz with the arrays frames (n, height, width, 3) and steps for fmt 'npz'.
+    Frames are written as they are rendered, so memory does not grow with the length of the game.
+    Returns the number of frames.
+    """
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    game_replay = replay.load(path)
+    frames = iter_frames(game_replay, every, bot_name, crop)
+
+    if fmt == 'png':
+        frame_dir = os.path.join(out_dir, name)
+        os.makedirs(frame_dir, exist_ok=True)
+        n_frames = 0
+        for step, frame in frames:
+            pygame.image.save(pygame.image.frombuffer(frame.tobytes(), frame.shape[1::-1], 'RGB'),
+                              os.path.join(frame_dir, f'{step:06d}.png'))
+            n_frames += 1
+        return n_frames
+
+    if fmt == 'npz':
+        # a compressed .npz is a zip of .npy files: write the header of the frames array
+        # for the known number of frames, then stream the frames into it one by one
+        os.makedirs(out_dir, exist_ok=True)
+        steps = np.array(frame_steps(len(game_replay), every), dtype=np.uint32)
+        with zipfile.ZipFile(os.path.join(out_dir, f'{name}.npz'), 'w', zipfile.ZIP_DEFLATED) as archive:
+            with archive.open('steps.npy', 'w') as f:
+                np.lib.format.write_array(f, steps)
+            with archive.open('frames.npy', 'w', force_zip64=True) as f:
+                n_frames = 0
+                for step, frame in frames:
+                    if n_frames == 0:
+                        header = np.lib.format.header_data_from_array_1_0(frame)
+                        header['shape'] = (len(steps),) + frame.shape
+                        np.lib.format.write_array_header_1_0(f, header)
+                    if n_frames >= len(steps) or step != steps[n_frames]:
+                        raise ValueError(f'{path} ended at an unexpected step, it may be damaged.')
+                    f.write(frame.tobytes())
+                    n_frames += 1
+        if n_frames != len(steps):
+            raise ValueError(f'{path} ended at an unexpected step, it may be damaged.')
+        return n_frames
+
+    raise ValueError(f"fmt must be 'png' or 'npz', not {fmt!r}.")
+
+
+def _render_replay(task):
+    """Worker function of render_replays."""
+    path, out_dir, fmt, every, bot_name, crop = task
+    return render_replay(path, out_dir, fmt, every, bot_name, crop)
+
+
+def render_replays(paths, out_dir, fmt='png', every=1, bot_name=None, crop=None, processes=None):
+    """
+    Renders many replay files with render_replay, one replay per task on a pool of
+    processes (default: one per core). Returns the number of frames of every replay.
+    """
+
+    tasks = [(path, out_dir, fmt, every, bot_name, crop) for path in paths]
+    if processes == 1:
+        return list(map(_render_replay, tasks))
+    with mp.Pool(processes) as pool:
+        return pool.map(_render_replay, tasks, chunksize=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render replays of snake games to PNG sequences or arrays.')
+    parser.add_argument('replays', nargs='+', help='replay files')
+    parser.add_argument('--out', default='frames', help='output directory')
+    parser.add_argument('--format', choices=['png', 'npz'], default='png',
+                        help='a PNG per frame, or one compressed array file per game')
+    parser.add_argument('--every', type=int, default=1, help='render every this many steps')
+    parser.add_argument('--crop', nargs='+', default=None, metavar='RECT',
+                        help="'board', or the rect X Y WIDTH HEIGHT in pixels (default: the whole window)")
+    parser.add_argument('--bot-name', default=None, help='player name to draw in the header')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    crop = args.crop
+    if crop is not None:
+        if crop == ['board']:
+            crop = 'board'
+        elif len(crop) == 4:
+            crop = tuple(int(value) for value in crop)
+        else:
+            parser.error("--crop takes 'board' or X Y WIDTH HEIGHT.")
+
+    n_frames = render_replays(args.replays, args.out, args.format, args.every, args.bot_name, crop, args.processes)
+    print(f'Rendered {sum(n_frames)} frames of {len(n_frames)} replays to {args.out}')
@@ -7,11 +7,11 @@ Date:   January 2020
 ----------------------
 '''
 
-import pygame 
 import numpy as np
-from time import time 
 import operator 
 
+from engine import DIRECTION_CODES
+
 
 class BasePlayer:
 
@@ -20,11 +20,16 @@ class BasePlayer:
     Create a class that inherits from this one and modify the my_bot method.
     See examples below this class definition.
     """
+
+    # Set to True (or 'body_age') in a bot that reads the NumPy observation App.observation,
+    # so that the games it plays keep one up to date (see observation.py)
+    observation = False
     
     def __init__(self):
         """Constructs the Player."""
         self.permissible_actions = ('up', 'down', 'left', 'right', None)
         self.bot_name = 'template'
+        self.bot_version = None  # set it to tell apart the results of changed bots with the same name
     
     def __repr__(self):
         """Repr method simply returns bot name."""
@@ -33,24 +38,40 @@ class BasePlayer:
     def __call__(self, App):
         """
         Make the class callable such that it can be stored directly to App.player.
-        The Player instance will be called within the game loop.
-        This function does 2 things.
+        The Player instance will be called once per step, either by the windowed App
+        or by the headless Game in engine.py. This function does 2 things.
             1. Call the Player.my_bot function to come up with an action based on some model.
-            2. Trigger the corresponding keystrokes, e.g. "W" for "up".
+            2. Check the action and return it to the game, which applies it directly.
         """
 
         # Call the my_bot method to determine an action based on the game state
         action = self.my_bot(App)
 
         # check the output
-        
         if action not in self.permissible_actions:
             raise ValueError(f'Invalid action. Make sure it is in {self.permissible_actions}')
-            
-        # translate action into a keystroke to control the game
-        self._generate_wasd_keystrokes(action)
 
-        pygame.time.wait(20)
+        return action
+
+    def my_bot_batch(self, states):
+        """
+        Decides for many games at once, e.g. for the games of a batch_env.BatchGame, which is
+        passed as states. Returns an array with one action code per game (0-3 for 'up', 'down',
+        'left', 'right' and -1 to keep the direction, see batch_env.ACTIONS).
+        Overwrite it with array operations on the stacked state (states.head_x, states.occupied,
+        states.features(), ...) to evaluate a policy on thousands of games per call.
+        By default, my_bot is called once per game on a single-game copy, which works for every
+        bot but is slow.
+        """
+
+        actions = np.empty(states.n_games, dtype=np.int8)
+        for i in range(states.n_games):
+            game = states.game(i)
+            if self.observation:
+                game.observe(body_age=self.observation == 'body_age')
+            action = self(game)
+            actions[i] = -1 if action is None else DIRECTION_CODES[action]
+        return actions
 
     def my_bot(self, App):
         """
@@ -83,28 +104,17 @@ class BasePlayer:
         
         # the scores can be extracted from App.score
 
+        # to look ahead, take an immutable snapshot and step it forward (see state.py)
+        # state = GameState.from_game(App); state.legal_actions(); state.simulate(['up', 'left'])
+
+        # learning bots can read the board as NumPy arrays instead (set observation = True, see observation.py)
+        # App.observation.planes; App.observation.features
+
         # default: wait for human keystrokes by setting action to None 
         action = None
 
         return action 
 
-    def _generate_wasd_keystrokes(self, action):
-        """Tranforms the action provided into a keystroke to control the game."""
-
-        if action is None:
-            return
-
-        actions_and_keystrokes = {'up':    ('w', pygame.K_w),
-                                  'down':  ('s', pygame.K_s),
-                                  'left':  ('a', pygame.K_a),
-                                  'right': ('d', pygame.K_d)}
-        
-        # create the event based on the action 
-        keypress = pygame.event.Event(pygame.KEYDOWN, unicode=actions_and_keystrokes[action][0],
-                                     key=actions_and_keystrokes[action][1], mod=pygame.KMOD_NONE) 
-        # add the event to the queue
-        pygame.event.post(keypress) 
-
 # -------------------------------------------------------------------------------
 # ----------------------- write your own bots below -----------------------------
 # -------------------------------------------------------------------------------
@@ -0,0 +1,199 @@
+'''
+Instrumentation of the game loop.
+
+A Profiler collects counters (steps, frames, deadline misses, food placements)
+and a streaming latency histogram per phase of the loop (bot decision, event
+draining, death check, food, move, render). Recording a value is O(1) and keeps
+no samples, so it can stay switched on for long runs. Results are exported as
+JSON or CSV at the end of a run, or periodically.
+
+    profiler = Profiler()
+    game.profiler = profiler       # engine phases: death check, food, move
+    App.profiler = profiler        # adds bot decision, events and render
+    ...
+    profiler.export('profile.json')
+
+CProfiledPlayer wraps a player and runs cProfile only while the bot decides.
+'''
+
+import cProfile
+import csv
+import json
+import math
+from time import perf_counter, time
+
+from player import BasePlayer
+
+
+class LatencyHistogram:
+    """Streaming histogram of durations in seconds with logarithmic buckets.
+    With 100 buckets per decade, percentiles are accurate to about 2.3%."""
+
+    def __init__(self, min_value=1e-7, max_value=1e3, buckets_per_decade=100):
+        self.log_min = math.log10(min_value)
+        self.buckets_per_decade = buckets_per_decade
+        self.counts = [0] * (int((math.log10(max_value) - self.log_min) * buckets_per_decade) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def record(self, value):
+        """Adds one duration."""
+
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+        i = int((math.log10(value) - self.log_min) * self.buckets_per_decade) if value > 0 else 0
+        self.counts[min(max(i, 0), len(self.counts)-1)] += 1
+
+    def percentile(self, q):
+        """Returns the q-th percentile (0-100), estimated as the middle of its bucket."""
+
+        if self.count == 0:
+            return float('nan')
+
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(10 ** (self.log_min + (i + 0.5) / self.buckets_per_decade), self.max)
+        return self.max
+
+    def merge(self, other):
+        """Adds the counts of another histogram with the same buckets."""
+
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        """Returns count, total and the mean, percentiles and maximum in microseconds."""
+
+        mean = self.total / self.count if self.count else float('nan')
+        return {'count': self.count,
+                'total_s': self.total,
+                'mean_us': 1e6 * mean,
+                'p50_us': 1e6 * self.percentile(50),
+                'p95_us': 1e6 * self.percentile(95),
+                'p99_us': 1e6 * self.percentile(99),
+                'max_us': 1e6 * self.max}
+
+
+class Profiler:
+    """Counters and per-phase latency histograms of a run."""
+
+    def __init__(self, export_path=None, export_every=None):
+        """
+        export_path and export_every (in seconds) turn on periodic exports through
+        maybe_export(), which the game loop calls once per step.
+        """
+        self.counters = {}
+        self.phases = {}
+        self.export_path = export_path
+        self.export_every = export_every
+        self._last_export = time()
+
+    def count(self, name, n=1):
+        """Increments a counter."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, phase, duration):
+        """Records the duration in seconds of one pass through a phase."""
+
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = LatencyHistogram()
+        histogram.record(duration)
+
+    def merge(self, other):
+        """Adds the counters and histograms of another profiler, e.g. of a worker process."""
+
+        for name, n in other.counters.items():
+            self.count(name, n)
+        for phase, histogram in other.phases.items():
+            if phase in self.phases:
+                self.phases[phase].merge(histogram)
+            else:
+                self.phases[phase] = histogram
+
+    def summary(self):
+        """Returns the counters and the summary of every phase as a dict."""
+        return {'counters': dict(self.counters),
+                'phases': {phase: histogram.summary() for phase, histogram in self.phases.items()}}
+
+    def report(self):
+        """Formats the summary as a plain text table."""
+
+        header = f'{"phase":<16}{"count":>10}{"total s":>10}{"mean us":>10}{"p50 us":>10}{"p95 us":>10}{"p99 us":>10}{"max us":>10}'
+        lines = [header, '-'*len(header)]
+        for phase, s in self.summary()['phases'].items():
+            lines.append(f'{phase:<16}{s["count"]:>10}{s["total_s"]:>10.3f}{s["mean_us"]:>10.1f}'
+                         f'{s["p50_us"]:>10.1f}{s["p95_us"]:>10.1f}{s["p99_us"]:>10.1f}{s["max_us"]:>10.1f}')
+        lines.append('')
+        lines.extend(f'{name:<16}{n:>10}' for name, n in self.counters.items())
+        return '\n'.join(lines)
+
+    def export(self, path):
+        """Writes the summary to path, as CSV if it ends in .csv and as JSON otherwise."""
+
+        summary = self.summary()
+        if path.endswith('.csv'):
+            fields = ['kind', 'name', 'count', 'total_s', 'mean_us', 'p50_us', 'p95_us', 'p99_us', 'max_us']
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fields)
+                writer.writeheader()
+                for phase, s in summary['phases'].items():
+                    writer.writerow({'kind': 'phase', 'name': phase, **s})
+                for name, n in summary['counters'].items():
+                    writer.writerow({'kind': 'counter', 'name': name, 'count': n})
+        else:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+
+    def maybe_export(self):
+        """Exports to export_path if export_every seconds have passed since the last export."""
+
+        if self.export_every is not None and time() - self._last_export >= self.export_every:
+            self._last_export = time()
+            self.export(self.export_path)
+
+
+class CProfiledPlayer(BasePlayer):
+    """Wraps a player and runs cProfile only while it decides."""
+
+    def __init__(self, player, cprofile=None):
+        """Wraps player. Pass a cProfile.Profile to collect several players into one profile."""
+        super().__init__()
+        self.player = player
+        self.bot_name = player.bot_name
+        self.bot_version = player.bot_version
+        self.observation = player.observation
+        self.cprofile = cProfile.Profile() if cprofile is None else cprofile
+
+    def __call__(self, App):
+        self.cprofile.enable()
+        try:
+            return self.player(App)
+        finally:
+            self.cprofile.disable()
+
+    def dump_stats(self, path):
+        """Saves the collected statistics, to be read with pstats or snakeviz."""
+        self.cprofile.dump_stats(path)
+
+
+def timed(profiler, phase, function, *args):
+    """Calls function(*args) and records its duration under phase if profiler is not None."""
+
+    if profiler is None:
+        return function(*args)
+
+    tstart = perf_counter()
+    try:
+        return function(*args)
+    finally:
+        profiler.record(phase, perf_counter() - tstart)
@@ -0,0 +1,210 @@
+'''
+Bots that run in another process.
+
+RemotePlayer is a player that forwards its decisions to a bot process over a
+Unix socket or over the stdin/stdout pipes of a subprocess. The bot runs in
+isolation, does not share the GIL with the game and can be written in any
+language, because the protocol is a few lines of binary:
+
+    On connecting, the bot sends its name: 1 byte length, then UTF-8.
+    A request is a batch of game states, all little endian:
+        batch header  2s B I     magic b'SN', protocol version, number of states
+                                 (a batch of 0 states closes the connection)
+        per state     H H B i I I
+                                 columns, rows, direction (0 up, 1 down, 2 left,
+                                 3 right), food cell (-1 if there is none),
+                                 iteration, length of the snake
+                      I * length cells of the snake, tail first and head last
+    The reply is one byte per state: the direction code, or 255 to keep going.
+
+Cells are flat indices, row*columns + column. The connection stays open across
+steps and games. A BatchGame sends all of its games in one batch.
+
+A reference bot server runs any player class from player.py:
+
+$ python remote.py --player SimplePlayer --socket /tmp/snake.sock
+
+    bot = RemotePlayer(address='/tmp/snake.sock')
+    bot = RemotePlayer(command=['python', 'remote.py', '--player', 'SimplePlayer', '--stdio'])
+'''
+
+import argparse
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+
+import numpy as np
+
+import player as players
+from engine import Game, DIRECTIONS, DIRECTION_CODES
+from player import BasePlayer
+
+
+MAGIC = b'SN'
+VERSION = 1
+BATCH = struct.Struct('<2sBI')
+STATE = struct.Struct('<HHBiII')
+KEEP = 255
+
+
+def _read(rfile, n):
+    """Reads exactly n bytes."""
+    data = rfile.read(n)
+    if len(data) < n:
+        raise ConnectionError('The other side closed the connection.')
+    return data
+
+
+def encode_game(game):
+    """Encodes the state of a Game (or of the game of an App) as one state of a batch."""
+
+    game = getattr(game, 'game', game)
+    body = np.array([game.cell_index(pos) for pos in game.snake.body], dtype='<u4')
+    food = -1 if game.food_pos is None else game.cell_index(game.food_pos)
+    return STATE.pack(game.n_cols, game.n_rows, DIRECTION_CODES[game.snake.current_direction], food,
+                      game.iteration, len(body)) + body.tobytes()
+
+
+def decode_game(rfile):
+    """Reads one state of a batch and returns it as a Game in cell coordinates (see Game.from_cells)."""
+
+    n_cols, n_rows, direction, food, iteration, length = STATE.unpack(_read(rfile, STATE.size))
+    body = np.frombuffer(_read(rfile, 4*length), dtype='<u4')
+    return Game.from_cells(n_cols, n_rows, body, DIRECTIONS[direction], None if food < 0 else food, iteration)
+
+
+class RemotePlayer(BasePlayer):
+    """A player whose decisions are made by a bot in another process."""
+
+    def __init__(self, address=None, command=None):
+        """
+        Connects to the bot server listening on the Unix socket address, or starts the bot
+        with command (a list, as for subprocess) and talks to it over its stdin and stdout.
+        """
+        super().__init__()
+        if (address is None) == (command is None):
+            raise ValueError('Give either the address of a Unix socket or the command that starts the bot.')
+
+        self._socket = self._process = None
+        if address is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(address)
+            self._rfile, self._wfile = self._socket.makefile('rb'), self._socket.makefile('wb')
+        else:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._rfile, self._wfile = self._process.stdout, self._process.stdin
+
+        self.bot_name = _read(self._rfile, _read(self._rfile, 1)[0]).decode()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _ask(self, states, n_states):
+        """Sends a batch of encoded states and returns the action codes of the reply."""
+        self._wfile.write(BATCH.pack(MAGIC, VERSION, n_states) + states)
+        self._wfile.flush()
+        return _read(self._rfile, n_states)
+
+    def my_bot(self, App):
+        """Asks the bot about the current state."""
+
+        code = self._ask(encode_game(App), 1)[0]
+        if code == KEEP:
+            return None
+        if code >= len(DIRECTIONS):
+            raise ValueError(f'The bot answered with the invalid action code {code}.')
+        return DIRECTIONS[code]
+
+    def my_bot_batch(self, states):
+        """Asks the bot about all games of a BatchGame in a single message."""
+
+        messages = []
+        for i in range(states.n_games):
+            slots = (states.tail[i] + np.arange(states.length[i])) % states.n_cells
+            messages.append(STATE.pack(states.n_cols, states.n_rows, states.direction[i], states.food[i],
+                                       states.iteration[i], states.length[i]))
+            messages.append(states.body[i, slots].astype('<u4').tobytes())
+
+        codes = np.frombuffer(self._ask(b''.join(messages), states.n_games), dtype=np.uint8)
+        return codes.astype(np.int8)  # 255 becomes -1, keep the direction
+
+    def close(self):
+        """Says goodbye to the bot and closes the connection. A bot started by command exits."""
+
+        try:
+            self._wfile.write(BATCH.pack(MAGIC, VERSION, 0))
+            self._wfile.flush()
+        except (BrokenPipeError, ConnectionError, ValueError):
+            pass
+        self._wfile.close()
+        self._rfile.close()
+        if self._socket is not None:
+            self._socket.close()
+        if self._process is not None:
+            self._process.wait()
+
+
+def serve(player, rfile, wfile):
+    """Answers batches of states with player until the client says goodbye or disconnects."""
+
+    name = player.bot_name.encode()
+    wfile.write(bytes([len(name)]) + name)
+    wfile.flush()
+
+    while True:
+        header = rfile.read(BATCH.size)
+        if len(header) < BATCH.size:
+            return
+        magic, version, n_states = BATCH.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a snake bot client, or one that speaks an incompatible version.')
+        if n_states == 0:
+            return
+
+        actions = []
+        for _ in range(n_states):
+            game = decode_game(rfile)
+            if player.observation:
+                game.observe(body_age=player.observation == 'body_age')
+            actions.append(player(game))
+        wfile.write(bytes(KEEP if action is None else DIRECTION_CODES[action] for action in actions))
+        wfile.flush()
+
+
+def serve_socket(player_class, address):
+    """Listens on the Unix socket address and serves every connection with its own player."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve(player_class(), self.rfile, self.wfile)
+
+    if os.path.exists(address):
+        os.remove(address)
+    with socketserver.ThreadingUnixStreamServer(address, Handler) as server:
+        print(f'Serving {player_class.__name__} on {address}', file=sys.stderr)
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reference bot server for RemotePlayer.')
+    parser.add_argument('--player', default='SimplePlayer', help='name of a player class in player.py')
+    parser.add_argument('--socket', default=None, help='listen on this Unix socket')
+    parser.add_argument('--stdio', action='store_true', help='serve a single client over stdin and stdout')
+    args = parser.parse_args()
+
+    player_class = getattr(players, args.player)
+    if args.stdio:
+        # stdout carries the protocol, anything the bot prints goes to stderr
+        rfile, wfile = sys.stdin.buffer, sys.stdout.buffer
+        sys.stdout = sys.stderr
+        serve(player_class(), rfile, wfile)
+    elif args.socket is not None:
+        serve_socket(player_class, args.socket)
+    else:
+        parser.error('Give --socket or --stdio.')
@@ -0,0 +1,151 @@
+'''
+Compact replays of snake games.
+
+A game is fully determined by its seed and the direction the snake took in
+every step, so that is all a replay stores: a small header with the board
+geometry and the seed, followed by the directions packed at 2 bits per step.
+The Replayer rebuilds any step by re-simulating the game with the headless
+engine, which is fast enough to seek anywhere in a long game.
+
+    replay.save(game, 'game.replay')        # after (or during) a game
+    replayer = Replayer('game.replay')
+    replayer.seek(500)                      # replayer.game is now at step 500
+
+To watch a replay, run
+
+$ python snake_game.py --replay game.replay
+'''
+
+import struct
+
+import numpy as np
+
+from engine import Game, DIRECTIONS
+
+
+# file layout: magic, version, grid width and height, cell size, margins, seed, number of steps
+MAGIC = b'SNKR'
+VERSION = 1
+HEADER = struct.Struct('<4sB5HQI')
+
+
+def pack_directions(codes):
+    """Packs direction codes (0-3) into bytes, 4 steps per byte, first step in the lowest bits."""
+
+    codes = np.frombuffer(bytes(codes), dtype=np.uint8)
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    padded = padded.reshape(-1, 4)
+    return (padded[:, 0] | padded[:, 1] << 2 | padded[:, 2] << 4 | padded[:, 3] << 6).tobytes()
+
+
+def unpack_directions(data, n_steps):
+    """Inverse of pack_directions: returns an array of n_steps direction codes."""
+
+    packed = np.frombuffer(data, dtype=np.uint8)
+    codes = (packed[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+    return codes.reshape(-1)[:n_steps]
+
+
+class Replay:
+    """The seed, board geometry and directions of one recorded game."""
+
+    def __init__(self, seed, directions, grid_size=(400, 400), cell_size=10, margin_left=10, margin_top=90):
+        self.seed = seed
+        self.directions = np.asarray(directions, dtype=np.uint8)
+        self.grid_size = tuple(grid_size)
+        self.cell_size = cell_size
+        self.margin_left = margin_left
+        self.margin_top = margin_top
+
+    def __len__(self):
+        return len(self.directions)
+
+    @classmethod
+    def from_game(cls, game):
+        """Creates the replay of a game, up to its current step."""
+        return cls(game.seed, np.frombuffer(bytes(game.directions_taken), dtype=np.uint8),
+                   game.grid_size, game.cell_size, game.margin_left, game.margin_top)
+
+    def new_game(self):
+        """Returns a headless game at step 0 of the replay."""
+        return Game(self.grid_size, self.cell_size, self.margin_left, self.margin_top, seed=self.seed)
+
+    def to_bytes(self):
+        """Serializes the replay into its binary file format."""
+
+        if not 0 <= self.seed < 2**64:
+            raise ValueError(f'Only seeds in [0, 2**64) can be saved, not {self.seed}.')
+
+        header = HEADER.pack(MAGIC, VERSION, *self.grid_size, self.cell_size, self.margin_left,
+                             self.margin_top, self.seed, len(self))
+        return header + pack_directions(self.directions)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Deserializes a replay from its binary file format."""
+
+        magic, version, width, height, cell_size, margin_left, margin_top, seed, n_steps = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a snake replay, or one written by an incompatible version.')
+
+        directions = unpack_directions(data[HEADER.size:], n_steps)
+        return cls(seed, directions, (width, height), cell_size, margin_left, margin_top)
+
+
+def save(game, path):
+    """Saves the replay of a game (a Game or an App) to path."""
+
+    game = getattr(game, 'game', game)
+    with open(path, 'wb') as f:
+        f.write(Replay.from_game(game).to_bytes())
+
+
+def load(path):
+    """Loads a replay from path."""
+
+    with open(path, 'rb') as f:
+        return Replay.from_bytes(f.read())
+
+
+class Replayer:
+    """Plays a replay back in a headless game that can be moved to any step."""
+
+    def __init__(self, replay):
+        """Constructs the replayer from a Replay or the path of a replay file."""
+
+        self.replay = load(replay) if isinstance(replay, str) else replay
+        self.game = self.replay.new_game()
+
+    def __len__(self):
+        return len(self.replay)
+
+    @property
+    def position(self):
+        """The number of steps played so far."""
+        return self.game.iteration - 1
+
+    @property
+    def finished(self):
+        return self.position >= len(self.replay) or self.game.done
+
+    def advance(self, n_steps=1):
+        """Plays up to n_steps further steps. Returns the result of the last game.step call."""
+
+        result = None
+        directions = self.replay.directions
+        for _ in range(n_steps):
+            if self.finished:
+                break
+            result = self.game.step(DIRECTIONS[directions[self.position]])
+        return result
+
+    def seek(self, step):
+        """Moves the game to the given step, re-simulating from the start if it lies behind."""
+
+        step = max(0, min(step, len(self.replay)))
+        if step < self.position:
+            self.game.reset(self.replay.seed)
+        self.advance(step - self.position)
+        return self.game
@@ -0,0 +1,186 @@
+'''
+Append-only store of game results in a local SQLite database.
+
+Every finished game becomes one row: bot name and version, seed, board,
+food eaten, steps, whether it was won and the decision latency. Rows are only
+ever appended, in batches: add() buffers results in memory and flush() writes
+the buffer in one transaction. The database runs in WAL mode, so many worker
+processes can append to the same file while others read from it.
+
+    with ResultsStore('results.db') as store:
+        store.add_many(run_tournament(...))
+        store.top(k=10, bot_name='simpleBot')
+        store.best_scores()
+        store.compare_seeds('simpleBot', 'random')
+        store.distribution('simpleBot')
+
+The indexes cover the queries above, so they stay fast with millions of games.
+'''
+
+import sqlite3
+from time import time
+
+
+COLUMNS = ('bot_name', 'bot_version', 'seed', 'n_cols', 'n_rows', 'food_eaten', 'steps', 'won',
+           'mean_latency', 'max_latency', 'created')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id           INTEGER PRIMARY KEY,
+    bot_name     TEXT    NOT NULL,
+    bot_version  TEXT,
+    seed         INTEGER NOT NULL,
+    n_cols       INTEGER NOT NULL,
+    n_rows       INTEGER NOT NULL,
+    food_eaten   INTEGER NOT NULL,
+    steps        INTEGER NOT NULL,
+    won          INTEGER NOT NULL,
+    mean_latency REAL,
+    max_latency  REAL,
+    created      REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_bot_score ON games (bot_name, food_eaten DESC);
+CREATE INDEX IF NOT EXISTS games_by_bot_board ON games (bot_name, n_cols, n_rows, food_eaten DESC);
+CREATE INDEX IF NOT EXISTS games_by_seed ON games (n_cols, n_rows, seed, bot_name);
+'''
+
+
+def _to_sqlite(seed):
+    """Seeds are unsigned 64 bit numbers, SQLite integers are signed: store them as two's complement."""
+    return seed - 2**64 if seed >= 2**63 else seed
+
+
+def _from_sqlite(seed):
+    return seed + 2**64 if seed < 0 else seed
+
+
+class ResultsStore:
+    """Buffered, append-only writer and indexed reader of game results."""
+
+    def __init__(self, path='results.db', buffer_size=1000, timeout=30):
+        """
+        Opens (or creates) the database at path. Buffered results are written as soon as
+        buffer_size of them are collected. timeout is how many seconds a writer waits for
+        another process to finish its transaction.
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------------------
+    # Writing
+
+    def add(self, result, bot_version=None, n_cols=None, n_rows=None):
+        """
+        Buffers the result of one game, a dict like the ones tournament.play_game returns.
+        bot_version and the board size in cells can be given here if the dict lacks them.
+        """
+
+        self._buffer.append((result['bot_name'],
+                             result.get('bot_version', bot_version),
+                             _to_sqlite(int(result['seed'])),
+                             int(result.get('n_cols', n_cols)),
+                             int(result.get('n_rows', n_rows)),
+                             int(result['food_eaten']),
+                             int(result['steps']),
+                             int(result['won']),
+                             result.get('mean_latency'),
+                             result.get('max_latency'),
+                             time()))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def add_many(self, results, **kwargs):
+        """Buffers the results of many games and writes them."""
+        for result in results:
+            self.add(result, **kwargs)
+        self.flush()
+
+    def flush(self):
+        """Writes all buffered results in a single transaction."""
+
+        if not self._buffer:
+            return
+        with self.connection:
+            self.connection.executemany(f'INSERT INTO games ({", ".join(COLUMNS)}) '
+                                        f'VALUES ({", ".join("?" * len(COLUMNS))})', self._buffer)
+        self._buffer = []
+
+    def close(self):
+        """Writes what is left in the buffer and closes the database."""
+        self.flush()
+        self.connection.close()
+
+    # ------------------------------------------------------------------------------
+    # Reading
+
+    def _query(self, sql, parameters=()):
+        cursor = self.connection.execute(sql, parameters)
+        names = [column[0] for column in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor]
+        for row in rows:
+            if 'seed' in row:
+                row['seed'] = _from_sqlite(row['seed'])
+        return rows
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def top(self, k=10, bot_name=None):
+        """Returns the k games with the most food eaten, of one bot or of all of them."""
+
+        if bot_name is None:
+            return self._query('SELECT * FROM games ORDER BY food_eaten DESC, steps ASC LIMIT ?', (k,))
+        return self._query('SELECT * FROM games WHERE bot_name = ? ORDER BY food_eaten DESC LIMIT ?',
+                           (bot_name, k))
+
+    def best_scores(self):
+        """Returns the most food eaten in a single game for every bot, as {bot_name: food_eaten}."""
+        rows = self.connection.execute('SELECT bot_name, MAX(food_eaten) FROM games GROUP BY bot_name')
+        return dict(rows.fetchall())
+
+    def best_score(self, bot_name, n_cols=None, n_rows=None):
+        """
+        Returns the most food bot_name has eaten in a single game, or None if it never played.
+        With n_cols and n_rows, only games on a board of that size count.
+        """
+
+        if n_cols is None or n_rows is None:
+            return self.connection.execute('SELECT MAX(food_eaten) FROM games WHERE bot_name = ?',
+                                           (bot_name,)).fetchone()[0]
+        return self.connection.execute('SELECT MAX(food_eaten) FROM games WHERE bot_name = ? AND n_cols = ? '
+                                       'AND n_rows = ?', (bot_name, n_cols, n_rows)).fetchone()[0]
+
+    def compare_seeds(self, bot_a, bot_b, n_cols=40, n_rows=40):
+        """
+        Returns one row per seed that both bots played on the board, with the mean food
+        eaten and steps of each bot on that seed (keys food_a, steps_a, food_b, steps_b).
+        """
+
+        return self._query(
+            'SELECT a.seed AS seed, a.food AS food_a, a.steps AS steps_a, b.food AS food_b, b.steps AS steps_b '
+            'FROM (SELECT seed, AVG(food_eaten) AS food, AVG(steps) AS steps FROM games '
+            '      WHERE n_cols = ? AND n_rows = ? AND bot_name = ? GROUP BY seed) AS a '
+            'JOIN (SELECT seed, AVG(food_eaten) AS food, AVG(steps) AS steps FROM games '
+            '      WHERE n_cols = ? AND n_rows = ? AND bot_name = ? GROUP BY seed) AS b '
+            'ON a.seed = b.seed ORDER BY a.seed',
+            (n_cols, n_rows, bot_a, n_cols, n_rows, bot_b))
+
+    def distribution(self, bot_name, bin_width=1):
+        """Returns the histogram of the food eaten by bot_name as {lower bin edge: number of games}."""
+
+        rows = self.connection.execute('SELECT (food_eaten / ?) * ? AS bin, COUNT(*) FROM games '
+                                       'WHERE bot_name = ? GROUP BY bin ORDER BY bin',
+                                       (bin_width, bin_width, bot_name))
+        return dict(rows.fetchall())
@@ -10,10 +10,52 @@ Date:   January 2020
 
 import numpy as np
 from copy import copy 
+from collections import deque
+from collections.abc import Sequence
+from itertools import islice
+
+
+class BodyView(Sequence):
+    """Read-only view of the body of a snake. Indexing the head or the tail is O(1),
+    a slice returns a new list of the cells in it."""
+
+    __slots__ = ('_cells',)
+
+    def __init__(self, cells):
+        self._cells = cells
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._cells))
+            if step == 1:
+                return list(islice(self._cells, start, max(start, stop)))
+            return [self._cells[i] for i in range(start, stop, step)]
+        return self._cells[index]
+
+    def __iter__(self):
+        return iter(self._cells)
+
+    def __reversed__(self):
+        return reversed(self._cells)
+
+    def __contains__(self, cell):
+        return cell in self._cells
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self._cells))
+
 
 class Snake:
-    def __init__(self, x=0, y=0):
-        """Construct a snake."""
+    def __init__(self, x=0, y=0, direction=None, cell_size=10):
+        """Construct a snake. If no direction is given, a random one is chosen."""
 
         # create directions (keys) and their corresponding opposites (values)
         self.directions = {'up':'down',
@@ -22,12 +64,73 @@ class Snake:
                            'right':'left'}
 
         # initialize body: initial position and direction
-        self.body = [[int(x), int(y)]]  # the body consists of a list of [xpos,ypos]
-        self.current_direction = np.random.choice(list(self.directions.keys()))
+        self.body = [[int(x), int(y)]]  # the body consists of [xpos,ypos] cells, tail first and head last
+        if direction is None:
+            direction = np.random.choice(list(self.directions.keys()))
+        elif direction not in self.directions:
+            raise ValueError(f'Wrong direction. Must be in {list(self.directions.keys())}.')
+        self.current_direction = direction
         
         # set cell size in pixels 
-        self.cell_size = 10
+        self.cell_size = cell_size
     
+    @property
+    def body(self):
+        """The body as a read-only sequence of [xpos,ypos] cells. Index, slice and iterate it like a list."""
+        return self._view
+
+    @body.setter
+    def body(self, cells):
+        # the occupancy set holds every body cell as a tuple so that lookups are O(1)
+        body = deque([int(x), int(y)] for x, y in cells)
+        self._release()
+        self._body = body
+        self._view = BodyView(self._body)
+        self._occupied = {(x, y) for x, y in self._body}
+
+        # the number of snakes that share the body and the occupancy set (see __copy__)
+        self._share = [1]
+
+    def __copy__(self):
+        """Copies share the body with this snake until one of them moves (copy-on-write), so copying is O(1)."""
+
+        new_snake = type(self).__new__(type(self))
+        new_snake.__dict__.update(self.__dict__)
+        self._share[0] += 1
+        return new_snake
+
+    def __del__(self):
+        self._release()
+
+    def _release(self):
+        """Stops sharing the body, e.g. before it is replaced."""
+        share = self.__dict__.get('_share')
+        if share is not None:
+            share[0] -= 1
+
+    def _own_body(self):
+        """Gives this snake its own copy of a shared body before it changes it. Costs O(length)."""
+
+        self._release()
+        self._body = self._body.copy()  # the cells are replaced when moving, never changed
+        self._view = BodyView(self._body)
+        self._occupied = self._occupied.copy()
+        self._share = [1]
+
+    def occupies(self, cell):
+        """Returns True if the snake's body covers the cell [xpos,ypos]."""
+        return (cell[0], cell[1]) in self._occupied
+
+    def hits_itself(self, cell, has_eaten=False):
+        """
+        Returns True if moving the head onto cell would bite the body. The tail cell
+        does not count because it moves away in the same step, unless the snake eats.
+        """
+        if (cell[0], cell[1]) not in self._occupied:
+            return False
+        tail = self._body[0]
+        return has_eaten or cell[0] != tail[0] or cell[1] != tail[1]
+
     def __repr__(self):
         """Repr method."""
         
@@ -36,7 +139,8 @@ class Snake:
     def change_direction(self, direction, return_copy=False):
         """Change direction of snake. If return_copy is True, the function will 
         create a copy of the snake, change its direction and return it without
-        affecting the instance the function was called on."""
+        affecting the instance the function was called on. The copy shares the
+        body until one of the two snakes moves, so looking ahead costs O(1)."""
 
         if direction not in self.directions:
             raise ValueError(f'Wrong direction. Must be in {list(self.directions.keys())}.')
@@ -54,24 +158,33 @@ class Snake:
         if not is_opposite:
             self.current_direction = direction
 
-    def move(self, has_eaten=False):
+    def move(self, has_eaten=False, new_head_cell=None):
         """
         Move the snake based on the direction. This consists of 2 steps.
-            Step 1. Add the new snake head to the body.
-            Step 2. If the snake has not grown, delete the last cell.
+            Step 1. If the snake has not grown, delete the last cell.
+            Step 2. Add the new snake head to the body.
+        The tail goes first so that the head may take over the cell it vacates.
+        The new head cell may be passed in if the caller has already computed it.
         """
 
+        if new_head_cell is None:
+            new_head_cell = self.next_head_position()
+        if self._share[0] > 1:
+            self._own_body()
+
         # Step 1
-        self.body.append(self.next_head_position()) 
+        if not has_eaten:
+            tail = self._body.popleft()
+            self._occupied.discard((tail[0], tail[1]))
 
         # Step 2
-        if not has_eaten:       
-            self.body.pop(0) 
+        self._body.append(new_head_cell)
+        self._occupied.add((new_head_cell[0], new_head_cell[1]))
 
     def next_head_position(self):
         """Computes new head position based on current position and direction."""
         
-        new_head_cell = self.body[-1][:]  # slice here so as not to bind!!!
+        new_head_cell = self._body[-1][:]  # slice here so as not to bind!!!
 
         if self.current_direction == 'left':
             new_head_cell[0] -= self.cell_size
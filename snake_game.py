@@ -11,63 +11,153 @@ Have a look at player.py and take it away!
 Author: Moritz Gruber
 Date:   January 2020
 ----------------------
-
-------------------------------------------------------------------
-TBD:
-- keep track of the number of games and remember highscores, 
-  implement returning the highscores and saving them to player
-  attribute and then to pkl
-- extend the framework to allow for the training of a genetic algo
-    * need to be able to record thousands of bots and their scores
 '''
 
 
+import argparse
+import os
 import pygame
-from snake import Snake
+from engine import Game
+from async_player import AsyncPlayer
+from profiler import Profiler, CProfiledPlayer, timed
+from results import ResultsStore
+from spectator import Spectator
+from offscreen import HeaderTexts, window_size, score_lines, draw_header, draw_score, draw_board
+import replay
+import player as players
 from player import *
 from copy import copy
 import numpy as np
-from time import time 
+from time import perf_counter, sleep
+from observation import BODY, HEAD, FOOD
+
+
+# Larger grids are drawn with the array renderer, scaled down to fit into this many pixels
+MAX_VIEW_SIZE = 800, 800
 
 
 class App:
     """This is the game itself."""
 
-    def __init__(self):
-        """Constructor for the game."""
+    def __init__(self, replay_file=None, board_size=(40, 40), cell_size=10, renderer=None):
+        """
+        Constructor for the game. board_size is the number of (columns, rows) of the board.
+        renderer is 'cells', which blits every cell, or 'array', which paints the board into
+        an array and scales it to the window; by default, boards that do not fit into
+        MAX_VIEW_SIZE pixels get the array renderer. If a replay file is given, the App
+        plays it back instead of running a player, on the board of the replay.
+        """
 
         # Initialize game state
         self._running = True
         self._display_surf = None
 
         # Initialize key graphical parameters
-        self.background = None
-        self.window_size = 420, 500
-        self.grid_size = self.xdim, self.ydim = 400, 400 
         self.margin_top = 90
         self.margin_left = self.margin_right = self.margin_bottom = 10
-        self.cell_size = 10
+        self.cell_size = cell_size
+        self.grid_size = self.xdim, self.ydim = board_size[0]*cell_size, board_size[1]*cell_size
+
+        # Create the headless game engine that holds the game state
+        self.game = Game(self.grid_size, self.cell_size, self.margin_left, self.margin_top)
 
         # Set player. This is where bot methods can be supplied. Try SimplePlayer or RandomPlayer!
         self.player = HumanPlayer()
 
         # Initialize game parameters
         self.step_duration = 30  # step duration in ms
-        
+        self.fps = 60  # the screen is redrawn at most this often
+        self.game_over_pause = 3  # seconds a finished game stays on screen
+
+        # Turbo mode runs the game as fast as the player answers and only draws it every
+        # turbo_render_steps steps or every turbo_render_ms ms, whichever comes first.
+        # Toggle it with the T key.
+        self.turbo = False
+        self.turbo_render_steps = None
+        self.turbo_render_ms = 100
+
+        # The player runs in a worker thread and must answer within the step duration.
+        # Late answers are replaced by the fallback: 'keep' (direction) or 'safe' (move)
+        self.bot_fallback = 'keep'
+
+        # Set a profiler.Profiler here to time the phases of the loop, and a file name
+        # to run cProfile on the player
+        self.profiler = None
+        self.cprofile_path = None
+
+        # Set a directory here to save the replay of every finished game
+        self.replay_dir = None
+
+        # Every finished game is appended to this results database (see results.py),
+        # which also remembers the best score of every player on every board size. Set it to None
+        # to keep nothing.
+        self.results_path = 'results.db'
+        self.results = None
+        self.best_score = None
+
+        # Set a spectator.Spectator here to watch games that run in worker processes
+        # instead of playing one. The window only shows snapshots of the watched game.
+        self.spectator = None
+
+        # Play back a replay instead of a live game
+        self.replayer = None
+        if replay_file is not None:
+            self.replayer = replay.Replayer(replay_file)
+            self.game = self.replayer.game
+            self.grid_size = self.xdim, self.ydim = self.game.grid_size
+            self.cell_size = self.game.cell_size
+            self.margin_left, self.margin_top = self.game.margin_left, self.game.margin_top
+
+        # The board is drawn at its size in pixels, or scaled down to fit the screen
+        fits = self.grid_size[0] <= MAX_VIEW_SIZE[0] and self.grid_size[1] <= MAX_VIEW_SIZE[1]
+        self.renderer = renderer or ('cells' if fits else 'array')
+        if self.renderer not in ('cells', 'array'):
+            raise ValueError(f"renderer must be 'cells' or 'array', not {self.renderer!r}.")
+        if self.renderer == 'cells' or fits:
+            self.view_size = self.grid_size
+        else:
+            scale = min(MAX_VIEW_SIZE[0] / self.grid_size[0], MAX_VIEW_SIZE[1] / self.grid_size[1])
+            self.view_size = round(scale*self.grid_size[0]), round(scale*self.grid_size[1])
+
+        # The window leaves room for the title and the score above the board
+        self.window_size = window_size(self.view_size, self.margin_left, self.margin_top, self.margin_right)
+
     def on_init(self):
         """Initial game setup."""
         
+        # The spectator's workers start before pygame, so they do not inherit it
+        if self.spectator is not None:
+            self.spectator.start()
+
         # Initialize pygame (I have no idea what this does)
         pygame.init()
-        print('Welcome to Le Serpent! Use WASD keys to play.')
+        if self.spectator is not None:
+            print(f'Welcome to Le Serpent! Watching {self.spectator.n_games} games of {self.player.bot_name}. '
+                  f'Use the arrow keys to switch games and F to follow the leader.')
+        elif self.replayer is None:
+            print('Welcome to Le Serpent! Use WASD keys to play and T for turbo mode.')
+        else:
+            print('Welcome to Le Serpent! Watching a replay. Use the arrow keys to skip 100 steps.')
         pygame.display.set_caption('Le Serpent')
 
-        # Start a new game
+        # Start the player and a new game. The array renderer draws the observation planes.
+        if self.player.observation or self.renderer == 'array':
+            self.game.observe(body_age=self.player.observation == 'body_age')
+        if self.cprofile_path is not None:
+            self.player = CProfiledPlayer(self.player)
+        self.bot = AsyncPlayer(self.player, deadline=self.step_duration/1000, fallback=self.bot_fallback)
+        self.bot.profiler = self.game.profiler = self.profiler
+
+        # Look up the best score of the player
+        if self.results_path is not None and self.replayer is None and self.spectator is None:
+            self.results = ResultsStore(self.results_path, buffer_size=1)
+            self.best_score = self.results.best_score(self.player.bot_name, self.game.n_cols, self.game.n_rows)
+            if self.best_score is not None:
+                print(f'Best score of {self.player.bot_name} on this board so far: {self.best_score} food.')
         self._new_game()
 
         # Initialize graphical elements
         self._display_surf = pygame.display.set_mode(self.window_size, pygame.HWSURFACE)
-        self.background = pygame.Surface(self.grid_size)
         self._running = True
         self.cell = pygame.Surface((self.snake.cell_size,self.snake.cell_size))
         self.cell_image = copy(self.cell)
@@ -77,80 +167,85 @@ class App:
         self.food_image = copy(self.cell)
         self.food_image.fill((0,255,0))
 
+        # Load the fonts and render the static texts once
+        self.texts = HeaderTexts(self.player.bot_name)
+        self.grid_rect = pygame.Rect(self.margin_left, self.margin_top, self.view_size[0], self.view_size[1])
+        self._score_texts = None
+        self._rendered = None
+
+        # Buffers of the array renderer: the board at one pixel per cell, and scaled to the view
+        if self.renderer == 'array':
+            n_cols, n_rows = self.game.n_cols, self.game.n_rows
+            self._pixels = np.zeros((n_cols, n_rows, 3), dtype=np.uint8)
+            self._board_surf = pygame.Surface((n_cols, n_rows), depth=24)
+            self._view_surf = pygame.Surface(self.view_size, depth=24)
+            self._view_surf.set_colorkey((0,0,0))
+
         # Tell the on_execute method that everything is fine
         return True 
 
     def _new_game(self):
         """Routine to start a new game."""
-        # Create and place snake
-        xpos = np.random.randint(self.margin_left, self.grid_size[0]+self.margin_left-self.cell_size)
-        ypos = np.random.randint(self.margin_top,  self.grid_size[0]+self.margin_top-self.cell_size)
-        self.snake = Snake(round(xpos, -1), round(ypos, -1))  # round to nearest 10 (snake cell size)
-        self.timer = time()
-        self.score = {'food_eaten':0, 'mean steps per food':' '}
-        self.will_die = False 
-        self.iteration = 1
-        self.mean_steps_per_food = '-'
-
-        # Create and place food
-        self._place_food()   
-    
-    def _place_food(self):
-        """Place a food cell somewhere on the canvas, ensuring it does not spawn directly
-        on the snake."""
-        
-        # Find a suitable position
-        while True:
-            # Generate random position within grid
-            xpos = np.random.randint(self.margin_left, self.grid_size[0]+self.margin_left-10)
-            ypos = np.random.randint(self.margin_top,  self.grid_size[0]+self.margin_top-10)
-            new_food_pos = [round(xpos, -1), round(ypos, -1)]
-            
-            # Check if overlaps with the snake body
-            if new_food_pos not in self.snake.body:
-                self.food_pos = new_food_pos
-                break
-
-    def _check_will_eat(self):
-        """Returns True if the snake head will land on a food cell in the next step and carries
-        out appropriate actions."""
-
-        if self.snake.next_head_position() == self.food_pos:
-            # Place new food 
-            self._place_food()
-            
-            # Update mean steps per food score
-            self.mean_steps_per_food = round((self.iteration+1)/(self.score['food_eaten']+1),2)
-            return True
+        if self.replayer is None and self.spectator is None:
+            self.game.reset()
+            self.bot.submit(self)
+        self._game_over_until = None
+
+    def _save_replay(self):
+        """Saves the replay of the current game to replay_dir, if it is set."""
+        if self.replay_dir is not None:
+            os.makedirs(self.replay_dir, exist_ok=True)
+            path = os.path.join(self.replay_dir, f'{self.player.bot_name}_{self.game.seed}.replay')
+            replay.save(self.game, path)
+            print(f'Replay saved to {path}')
+
+    def _save_result(self):
+        """Appends the finished game to the results database, if there is one."""
+
+        if self.results is None:
+            return
+
+        steps = self.iteration - 1
+        latencies = list(self.bot.latencies)[-steps:] if steps else []
+        self.results.add({'bot_name': self.player.bot_name,
+                          'bot_version': self.player.bot_version,
+                          'seed': self.game.seed,
+                          'n_cols': self.game.n_cols,
+                          'n_rows': self.game.n_rows,
+                          'food_eaten': self.score['food_eaten'],
+                          'steps': steps,
+                          'won': self.game.won,
+                          'mean_latency': sum(latencies) / len(latencies) if latencies else None,
+                          'max_latency': max(latencies) if latencies else None})
+        if self.best_score is None or self.score['food_eaten'] > self.best_score:
+            self.best_score = self.score['food_eaten']
+            print('New best score!')
+
+    # The game state lives in the headless engine. These properties keep the
+    # attributes bots have always used (App.snake, App.food_pos, ...) available.
+    @property
+    def snake(self):
+        return self.game.snake
+
+    @property
+    def food_pos(self):
+        return self.game.food_pos
+
+    @property
+    def score(self):
+        return self.game.score
+
+    @property
+    def iteration(self):
+        return self.game.iteration
+
+    @property
+    def observation(self):
+        return self.game.observation
 
-        else:
-            return False 
-    
     def _check_death(self, snake=None):
         """Returns True if the snake dies in the next iteration."""
-        
-        # Select which snake to check
-        if snake is not None:
-            if not isinstance(snake, Snake):
-                raise ValueError(f'snake needs to be Snake.snake, not {type(snake)}.')
-            snake_to_check = snake
-        else:
-            snake_to_check = self.snake
-
-        # Get next head position
-        head_x, head_y = snake_to_check.next_head_position()
-        
-        # Check death criteria
-        outside_bounds =  head_x >= self.grid_size[0]+self.margin_left or head_x < self.margin_left or \
-                          head_y >= self.grid_size[0]+self.margin_top or head_y < self.margin_top
-        eats_itself = [head_x, head_y] in snake_to_check.body  
-        death = outside_bounds or eats_itself 
-            
-        return death 
-
-    def _update_score(self):
-        self.score['food_eaten'] = len(self.snake.body)-1 
-        self.score['mean steps per food'] = self.mean_steps_per_food
+        return self.game._check_death(snake=snake)
 
     def on_event(self, event):
         """Captures keyboard events and executes the corresponding methods."""
@@ -160,6 +255,27 @@ class App:
             print("Au revoir!")
             self._running = False
         
+        # switch turbo mode on or off
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_t:
+            self.turbo = not self.turbo
+            print(f'Turbo mode {"on" if self.turbo else "off"}.')
+
+        # switch to another game or follow the leader
+        elif event.type == pygame.KEYDOWN and self.spectator is not None:
+            if event.key in (pygame.K_RIGHT, pygame.K_LEFT):
+                self.spectator.watch(self.spectator.watched + (1 if event.key == pygame.K_RIGHT else -1))
+                print(f'Watching game {self.spectator.watched} of {self.spectator.n_games}.')
+            elif event.key == pygame.K_f:
+                self.spectator.follow_leader = not self.spectator.follow_leader
+                print(f'Following the leader {"on" if self.spectator.follow_leader else "off"}.')
+
+        # skip through a replay
+        elif event.type == pygame.KEYDOWN and self.replayer is not None:
+            if event.key == pygame.K_RIGHT:
+                self.replayer.seek(self.replayer.position + 100)
+            elif event.key == pygame.K_LEFT:
+                self.replayer.seek(self.replayer.position - 100)
+
         # change direction
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_w:
@@ -171,114 +287,299 @@ class App:
             elif event.key == pygame.K_d:
                 self.snake.change_direction('right')
 
-    def on_loop(self):
-        """This loop runs over and over while the game is running."""
-
-        # Listen for player inputs and execute corresponding moves 
-        try:
-            tstart = time()
-
-            self.player(App=self)  # refer to Player.__call__ to understand this
-
-            if 1000*(time()-tstart) > (self.step_duration*0.75):
-                print('Your bot takes dangerously long. Try making it faster or increasing the step duration.')
+    def _handle_events(self):
+        """Executes the queued keystrokes."""
 
-        except:
-            print(f'There was a critical error in {self.player.bot_name}.\nExiting game.')
-            self._running = False
-
-        # Execute queued keystrokes
+        tstart = perf_counter()
         for event in pygame.event.get():
             self.on_event(event)
+        if self.profiler is not None:
+            self.profiler.record('events', perf_counter() - tstart)
 
-        # If a new step was reached, check death and move to next step
-        if 1000*(time()-self.timer) >= self.step_duration:
-            
-            # Check if death will occur
-            self.will_die = self._check_death()
-            
-            # move to next iteration
-            self.iteration += 1
-            self.timer = time()
-            self.snake.move(has_eaten=self._check_will_eat())
-            
-            # Check if death has occurred
-            if self.will_die:
-                print(f'You lost! You got {self.score["food_eaten"]} food with an average of {self.score["mean steps per food"]} steps per food.')
-                pygame.time.wait(3000)
+    def on_loop(self):
+        """Plays one step of the game. on_execute calls it once per step duration."""
+
+        if self.replayer is not None:
+            self.replayer.advance()
+            return
+
+        # A spectator only picks up the newest snapshot of the watched game, if there is one
+        if self.spectator is not None:
+            game = self.spectator.latest(self.margin_left, self.margin_top)
+            if game is not None:
+                if self.renderer == 'array':
+                    game.observe()
+                self.game = game
+            return
+
+        # A finished game stays on screen for a moment, without blocking input or rendering
+        if self._game_over_until is not None:
+            if perf_counter() >= self._game_over_until:
                 self._new_game()
-                return 
+            return
+
+        # Apply the player's action and move to the next step. The player has been thinking
+        # about it in the background since the last step. In turbo mode there is no time
+        # in between, so it gets up to the step duration to answer now.
+        timeout = self.step_duration/1000 if self.turbo else 0
+        self.game.change_direction(timed(self.profiler, 'bot_collect', self.bot.collect, timeout))
+        _, _, dead = self.game.step()
+        if self.profiler is not None:
+            self.profiler.maybe_export()
+
+        # Check if death has occurred or the board is full
+        if dead:
+            print(f'You lost! You got {self.score["food_eaten"]} food with an average of {self.score["mean steps per food"]} steps per food. (seed {self.game.seed})')
+        elif self.game.won:
+            print(f'You won! You filled the board with an average of {self.score["mean steps per food"]} steps per food. (seed {self.game.seed})')
+        if self.game.done:
+            self._save_replay()
+            self._save_result()
+            self._game_over_until = perf_counter() + (0 if self.turbo else self.game_over_pause)
+        else:
+            self.bot.submit(self)
 
-        # Update score 
-        self._update_score()
+    def _turbo_loop(self):
+        """Plays steps as fast as the player answers until the next frame is due."""
+
+        max_steps = self.turbo_render_steps or float('inf')
+        deadline = perf_counter() + self.turbo_render_ms/1000 if self.turbo_render_ms else float('inf')
+        if max_steps == deadline == float('inf'):
+            max_steps = 1
+
+        steps = 0
+        while self._running and steps < max_steps and perf_counter() < deadline:
+            self.on_loop()
+            steps += 1
 
     def on_render(self):
-        """This method draws the goings on in the game backend onto the screen."""
+        """
+        This method draws the goings on in the game backend onto the screen.
+        Nothing is drawn if the game has not moved since the last frame. After a single
+        step, only the cells that changed are redrawn and pushed to the screen.
+        """
+
+        # (snake, step) identifies what is on screen, a new game comes with a new snake
+        rendered = (self.snake, self.iteration)
+        if rendered == self._rendered:
+            return
+
+        tstart = perf_counter()
+        if self.renderer == 'array':
+            self._render_array()
+        elif self._rendered is not None and self._rendered[0] is self.snake and self._rendered[1] == self.iteration-1:
+            self._render_step()
+        else:
+            self._render_full()
+        if self.profiler is not None:
+            self.profiler.record('render', perf_counter() - tstart)
+            self.profiler.count('frames')
 
-        # Fill the display with black
-        self._display_surf.fill((0,0,0))
+        self._rendered = rendered
+        self._last_head = self.snake.body[-1][:]
+        self._last_tail = self.snake.body[0][:]
+        self._last_food = self.food_pos
 
-        # Draw the title
-        font = pygame.font.Font('freesansbold.ttf', 32)
-        title_text = font.render('Le Serpent', True, (0,255,0))
-        title_rect = title_text.get_rect() 
-        title_rect.topleft = (self.margin_left, 10)
-        self._display_surf.blit(title_text, title_rect) 
+    def _render_full(self):
+        """Redraws the whole window."""
+
+        self._render_header()
+
+        # Draw the border, the food and the snake, whose head is red
+        draw_board(self._display_surf, self.grid_rect, self.game)
 
-        # Draw the score
-        score_str_all = [f'Food eaten: {self.score["food_eaten"]}', f'Mean steps per food:  {self.score["mean steps per food"]}']
-        for idx, score_str in enumerate(score_str_all):
-            score_text = pygame.font.Font('freesansbold.ttf', 14).render(score_str, True, (255,255,255))    
-            score_rect = score_text.get_rect()
-            score_rect.topleft = (self.margin_left,50+idx*20)        
-            self._display_surf.blit(score_text, score_rect)
-
-        # Draw the player name
-        player_str = f'Player: {self.player.bot_name}'
-        font = pygame.font.Font('freesansbold.ttf', 12)
-        player_text = font.render(player_str[:40], True, (255,0,0))
-        player_rect = player_text.get_rect() 
-        player_rect.bottomleft = (210, 85)
-        self._display_surf.blit(player_text, player_rect) 
-
-
-        # Draw the border 
-        pygame.draw.rect(self._display_surf,(255,255,255),pygame.Rect(self.margin_left, self.margin_top, self.grid_size[0], self.grid_size[1]), 2)
-
-        # Draw the food
-        if self.food_pos is not None:
-            self._display_surf.blit(self.food_image,(self.food_pos))
-
-        # Draw the snake
-        for idx, cell in enumerate(self.snake.body):
-            # if its the head (last cell in self.snake.body), make it red
-            if idx == len(self.snake.body)-1:
-                self._display_surf.blit(self.head_image,(cell[0],cell[1]))
-            else:
-                self._display_surf.blit(self.cell_image,(cell[0],cell[1]))
-        
         # Make it happen
         pygame.display.flip()
 
+    def _render_header(self):
+        """Clears the window and draws the title, the score, the player name and the best score."""
+        draw_header(self._display_surf, self.texts, self.score, self.margin_left, self.best_score)
+        self._score_texts = score_lines(self.score)
+
+    def _render_array(self):
+        """
+        Paints the board into an array, one pixel per cell, from the observation planes of
+        the game, and pushes it to the screen in one blit, scaled to the view. The cost of a
+        frame depends on the size of the board but not on the length of the snake.
+        """
+
+        new_game = self._rendered is None or self._rendered[0] is not self.snake
+        if new_game:
+            self._render_header()
+
+        # white body, red head, green food
+        planes = self.game.observation.planes
+        body, head, food = planes[BODY].T, planes[HEAD].T, planes[FOOD].T
+        pixels = self._pixels
+        np.multiply(body, 255, out=pixels[:, :, 0], casting='unsafe')
+        np.multiply(body - head + food, 255, out=pixels[:, :, 1], casting='unsafe')
+        np.multiply(body - head, 255, out=pixels[:, :, 2], casting='unsafe')
+        pygame.surfarray.blit_array(self._board_surf, pixels)
+
+        # average the cells when shrinking, so that a thin snake does not disappear
+        if self.view_size[0] < self.game.n_cols or self.view_size[1] < self.game.n_rows:
+            pygame.transform.smoothscale(self._board_surf, self.view_size, self._view_surf)
+        else:
+            pygame.transform.scale(self._board_surf, self.view_size, self._view_surf)
+
+        # like the cell renderer, the cells are drawn over the border and the empty ones are not
+        self._display_surf.fill((0,0,0), self.grid_rect)
+        pygame.draw.rect(self._display_surf,(255,255,255),self.grid_rect, 2)
+        self._display_surf.blit(self._view_surf, self.grid_rect)
+
+        if new_game:
+            pygame.display.flip()
+            return
+        dirty = [self.grid_rect]
+        score_rect = self._render_score()
+        if score_rect is not None:
+            dirty.append(score_rect)
+        pygame.display.update(dirty)
+
+    def _render_score(self):
+        """Draws the score texts if they changed. Returns the rect to update, or None."""
+
+        score_str_all = score_lines(self.score)
+        if score_str_all == self._score_texts:
+            return None
+        self._score_texts = score_str_all
+        return draw_score(self._display_surf, self.texts, self.score, self.margin_left)
+
+    def _render_step(self):
+        """Redraws only the cells that changed in the last step: the vacated tail, the old
+        and the new head and the food, and updates just those rects."""
+
+        cs = self.cell_size
+        head = self.snake.body[-1]
+        dirty = []
+
+        # Erase the vacated tail and the eaten food. Erasing cells on the edge of the
+        # grid also erases the border, so it is redrawn within the erased rect.
+        for cell in (self._last_tail, self._last_food):
+            if cell is not None and not self.snake.occupies(cell) and cell != self.food_pos:
+                rect = self._display_surf.fill((0,0,0), (cell[0], cell[1], cs, cs))
+                self._display_surf.set_clip(rect)
+                pygame.draw.rect(self._display_surf,(255,255,255),self.grid_rect, 2)
+                self._display_surf.set_clip(None)
+                dirty.append(rect)
+
+        # Draw the food, the old head as body and the new head
+        if self.food_pos is not None and self.food_pos != self._last_food:
+            dirty.append(self._display_surf.blit(self.food_image, self.food_pos))
+        if self.snake.occupies(self._last_head) and self._last_head != head:
+            dirty.append(self._display_surf.blit(self.cell_image, self._last_head))
+        dirty.append(self._display_surf.blit(self.head_image, head))
+
+        # Draw the score
+        score_rect = self._render_score()
+        if score_rect is not None:
+            dirty.append(score_rect)
+
+        # Make it happen, but only where something changed
+        pygame.display.update(dirty)
+
     def on_cleanup(self):
+        if self.spectator is not None:
+            self.spectator.stop()
+            print(self.spectator.summary())
+        elif self.replayer is None:
+            stats = self.bot.stats()
+            print(f'{stats["bot_name"]}: {stats["deadline_misses"]} of {stats["calls"]} steps missed the deadline, '
+                  f'{stats["errors"]} errors, latency p50/p95/p99 {stats["p50_ms"]:.2f}/{stats["p95_ms"]:.2f}/{stats["p99_ms"]:.2f} ms')
+            self.bot.shutdown()
+        if self.results is not None:
+            self.results.close()
+        if self.profiler is not None:
+            print(self.profiler.report())
+            if self.profiler.export_path is not None:
+                self.profiler.export(self.profiler.export_path)
+        if self.cprofile_path is not None:
+            self.player.dump_stats(self.cprofile_path)
         pygame.quit()
  
     def on_execute(self):
-        """Method that runs when the module is launched."""
+        """
+        Method that runs when the module is launched. The game moves on exactly once per
+        step duration and the screen is redrawn at most fps times per second. In between,
+        the loop sleeps until the next step or frame is due. A spectator picks up snapshots
+        once per frame instead of once per step.
+        """
         if self.on_init() == False:
             self._running = False
- 
+
+        step_duration = 1/self.fps if self.spectator is not None else self.step_duration/1000
+        next_step = next_frame = perf_counter()
         while self._running:
-            # Run the main loop
-            self.on_loop()
-            
+            self._handle_events()
+
+            if self.turbo:
+                self._turbo_loop()
+                self.on_render()
+                next_step = next_frame = perf_counter()
+                continue
+
+            # Steps are scheduled on a fixed grid so they do not drift. If the loop fell
+            # behind by more than a step (e.g. while the window was dragged), the missed
+            # steps are dropped instead of played in a burst the player cannot keep up with.
+            now = perf_counter()
+            if now >= next_step:
+                self.on_loop()
+                next_step += step_duration
+                if next_step <= now:
+                    next_step = now + step_duration
+
             # Render the graphics
-            self.on_render()
+            if now >= next_frame:
+                self.on_render()
+                next_frame = now + 1/self.fps
+
+            idle = min(next_step, next_frame) - perf_counter()
+            if idle > 0:
+                sleep(idle)
 
         # Pack up and leave
         self.on_cleanup()
             
 
 if __name__ == "__main__" :
-    the_game = App()
+    parser = argparse.ArgumentParser(description='Le Serpent, a snake game with a framework for player bots.')
+    parser.add_argument('--replay', default=None, help='replay file to watch instead of playing')
+    parser.add_argument('--board', nargs=2, type=int, default=[40, 40], metavar=('COLUMNS', 'ROWS'),
+                        help='board size in cells')
+    parser.add_argument('--cell-size', type=int, default=10, help='cell size in pixels')
+    parser.add_argument('--renderer', choices=['cells', 'array'], default=None,
+                        help='draw every cell, or paint the board into an array scaled to the window '
+                             '(default: array if the board does not fit on the screen)')
+    parser.add_argument('--profile', default=None, help='export phase timings to this .json or .csv file')
+    parser.add_argument('--profile-every', type=float, default=None, help='also export every this many seconds')
+    parser.add_argument('--turbo', action='store_true', help='play as fast as the player answers (toggle with T)')
+    parser.add_argument('--turbo-steps', type=int, default=None, help='in turbo mode, draw every this many steps')
+    parser.add_argument('--turbo-ms', type=float, default=100, help='in turbo mode, draw every this many ms')
+    parser.add_argument('--fps', type=float, default=60, help='maximum frames per second')
+    parser.add_argument('--results', default='results.db', help='database to record the games and best scores in')
+    parser.add_argument('--no-results', action='store_true', help='do not record the games')
+    parser.add_argument('--cprofile', default=None, help='run cProfile on the player and save the stats to this file')
+    parser.add_argument('--player', default=None, help='name of a player class in player.py (default: HumanPlayer)')
+    parser.add_argument('--spectate', action='store_true',
+                        help='watch games of the player that run in worker processes instead of playing')
+    parser.add_argument('--workers', type=int, default=4, help='when spectating, number of worker processes')
+    parser.add_argument('--games', type=int, default=8, help='when spectating, number of games per worker')
+    args = parser.parse_args()
+
+    the_game = App(replay_file=args.replay, board_size=args.board, cell_size=args.cell_size, renderer=args.renderer)
+    if args.profile is not None:
+        the_game.profiler = Profiler(args.profile, args.profile_every)
+    the_game.cprofile_path = args.cprofile
+    the_game.results_path = None if args.no_results else args.results
+    the_game.turbo = args.turbo
+    the_game.turbo_render_steps = args.turbo_steps
+    the_game.turbo_render_ms = args.turbo_ms
+    the_game.fps = args.fps
+    if args.player is not None:
+        the_game.player = getattr(players, args.player)()
+    if args.spectate:
+        if args.player is None:
+            parser.error('--spectate needs a bot, give one with --player.')
+        the_game.spectator = Spectator(getattr(players, args.player), args.workers, args.games,
+                                       args.board, the_game.cell_size, fps=args.fps)
     the_game.on_execute()
\ No newline at end of file
@@ -0,0 +1,166 @@
+'''
+Spectator mode: many headless games run at full speed in worker processes,
+while the window shows one of them.
+
+Every worker plays its share of the games, one step of each in turn, and
+writes the score of every game into a shared array after each step. Only the
+worker that owns the watched game sends a snapshot of it, at most fps times
+per second, into a queue that holds a single snapshot. If the window has not
+picked up the last snapshot yet, the worker skips sending and goes on, so
+watching never slows the simulations down.
+
+$ python snake_game.py --spectate --player SimplePlayer --workers 4 --games 8
+
+In the window, the arrow keys switch to the next or previous game and F
+follows the game with the most food eaten.
+'''
+
+import multiprocessing as mp
+import queue
+from time import perf_counter
+
+import numpy as np
+
+from engine import Game
+
+
+# per game in the shared array: finished games, food eaten and steps of the current one, steps of all games
+EPISODES, FOOD_EATEN, STEPS, TOTAL_STEPS = range(4)
+N_FIELDS = 4
+
+
+def _play(player_class, slots, n_slots, board_size, cell_size, first_seed, stats, watched, snapshots, stop, fps):
+    """Worker function: plays the games in slots until stop is set. Runs in its own process."""
+
+    grid_size = board_size[0]*cell_size, board_size[1]*cell_size
+    games = [Game(grid_size, cell_size, seed=first_seed + slot) for slot in slots]
+    bots = [player_class() for _ in slots]
+    for game, bot in zip(games, bots):
+        if bot.observation:
+            game.observe(body_age=bot.observation == 'body_age')
+    last_snapshot = 0.
+
+    while not stop.is_set():
+        for slot, game, bot in zip(slots, games, bots):
+            game.step(bot(game))
+
+            i = N_FIELDS*slot
+            stats[i+FOOD_EATEN] = game.score['food_eaten']
+            stats[i+STEPS] = game.iteration - 1
+            stats[i+TOTAL_STEPS] += 1
+            if game.done:
+                stats[i+EPISODES] += 1
+                game.reset(first_seed + stats[i+EPISODES]*n_slots + slot)
+
+        # send a snapshot of the watched game, unless the window is behind
+        slot = watched.value
+        if slot in slots and perf_counter() - last_snapshot >= 1/fps:
+            last_snapshot = perf_counter()
+            game = games[slots.index(slot)]
+            body = np.array([game.cell_index(pos) for pos in game.snake.body], dtype=np.uint32)
+            food = None if game.food_pos is None else game.cell_index(game.food_pos)
+            try:
+                snapshots.put_nowait((slot, game.seed, game.snake.current_direction, food, game.iteration,
+                                      body.tobytes()))
+            except queue.Full:
+                pass
+
+
+class Spectator:
+    """Runs games of a player in worker processes and hands out snapshots of the watched one."""
+
+    def __init__(self, player_class, n_workers=4, games_per_worker=8, board_size=(40, 40), cell_size=10,
+                 first_seed=0, fps=60):
+        """
+        Plays n_workers*games_per_worker games of player_class on boards of board_size cells,
+        with the pixel coordinates of cells of cell_size pixels like in the window. Slot k plays the seeds first_seed + k, first_seed + k + n_games, ... one after the other.
+        """
+        self.player_class = player_class
+        self.n_workers = n_workers
+        self.n_games = n_workers * games_per_worker
+        self.board_size = tuple(board_size)
+        self.cell_size = cell_size
+        self.first_seed = first_seed
+        self.fps = fps
+
+        self.follow_leader = True
+        self._stats = mp.RawArray('q', N_FIELDS*self.n_games)
+        self._watched = mp.RawValue('i', 0)
+        self._snapshots = mp.Queue(maxsize=1)
+        self._stop = mp.Event()
+        self._workers = []
+        self._tstart = None
+
+    @property
+    def watched(self):
+        """The slot of the game that is watched."""
+        return self._watched.value
+
+    def start(self):
+        """Starts the worker processes."""
+
+        for w in range(self.n_workers):
+            slots = list(range(w, self.n_games, self.n_workers))
+            worker = mp.Process(target=_play, daemon=True,
+                                args=(self.player_class, slots, self.n_games, self.board_size, self.cell_size, self.first_seed,
+                                      self._stats, self._watched, self._snapshots, self._stop, self.fps))
+            worker.start()
+            self._workers.append(worker)
+        self._tstart = perf_counter()
+
+    def stop(self):
+        """Stops the worker processes and waits for them."""
+
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+    def stats(self):
+        """Returns the shared statistics as an (n_games, 4) array, see EPISODES and the other fields."""
+        return np.frombuffer(self._stats, dtype=np.int64).reshape(self.n_games, N_FIELDS).copy()
+
+    def leader(self):
+        """Returns the slot of the running game with the most food eaten."""
+        return int(np.argmax(self.stats()[:, FOOD_EATEN]))
+
+    def watch(self, slot):
+        """Watches the game in slot from now on and stops following the leader."""
+        self.follow_leader = False
+        self._watched.value = slot % self.n_games
+
+    def latest(self, margin_left=10, margin_top=90):
+        """
+        Returns the newest snapshot of the watched game as a Game with cells of cell_size pixels
+        and the given margins, or None if there is no new one. When following the leader,
+        switches to it first.
+        """
+
+        if self.follow_leader:
+            self._watched.value = self.leader()
+
+        snapshot = None
+        while True:
+            try:
+                snapshot = self._snapshots.get_nowait()
+            except queue.Empty:
+                break
+        if snapshot is None or snapshot[0] != self.watched:
+            return None
+
+        slot, seed, direction, food, iteration, body = snapshot
+        game = Game.from_cells(*self.board_size, np.frombuffer(body, dtype=np.uint32), direction, food, iteration,
+                               self.cell_size, margin_left, margin_top)
+        game.seed = seed
+        return game
+
+    def summary(self):
+        """Returns a line with the number of games and steps played and the steps per second."""
+
+        stats = self.stats()
+        elapsed = perf_counter() - self._tstart
+        steps = stats[:, TOTAL_STEPS].sum()
+        return (f'{self.n_games} slots played {stats[:, EPISODES].sum()} games and {steps} steps '
+                f'in {elapsed:.1f} s ({steps/elapsed:.0f} steps/s)')
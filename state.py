@@ -0,0 +1,283 @@
+'''
+Immutable, cheap-to-fork game states for search-based bots.
+
+A GameState is a frozen copy of a game that bots can step forward as often as
+they like without touching the live game:
+
+    root = GameState.from_game(App)
+    for action in root.legal_actions():
+        child = root.step(action)
+        ...
+
+Forking is cheap because states share structure. Every state points to a
+frozen base (body, free cells and random generator state of the game when the
+branch started) and only adds the cells its head has entered since then as a
+linked list of nodes. Stepping is O(1), collision checks are O(depth of the
+branch). Only when the snake eats is a new base built, so that the new food
+lands exactly where it would land in the real game.
+
+Every state carries the Zobrist hash of the game (see zobrist.py), updated in
+O(1) per step, so search bots can recognise positions they have seen before.
+'''
+
+import numpy as np
+
+from engine import DIRECTIONS, DIRECTION_CODES
+from zobrist import keys_for
+
+
+# unit steps of the directions and their opposites
+STEPS = {'up': (0, -1), 'down': (0, 1), 'left': (-1, 0), 'right': (1, 0)}
+OPPOSITES = {'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'}
+
+
+class _Base:
+    """The frozen part shared by all states of a branch. Cells are flat indices."""
+
+    __slots__ = ('geometry', 'keys', 'body', 'index', 'free_cells', 'rng_state')
+
+    def __init__(self, geometry, body, free_cells, rng_state):
+        self.geometry = geometry
+        self.keys = keys_for(geometry[0] * geometry[1])
+        self.body = tuple(body)
+        self.index = {cell: i for i, cell in enumerate(self.body)}
+        self.free_cells = free_cells
+        self.rng_state = rng_state
+
+
+class _Node:
+    """A cell entered by the head, linked to the cell entered before it."""
+
+    __slots__ = ('cell', 'prev')
+
+    def __init__(self, cell, prev):
+        self.cell = cell
+        self.prev = prev
+
+
+class GameState:
+    """An immutable snapshot of a game. step() returns a new state and leaves this one untouched."""
+
+    __slots__ = ('_base', '_path', '_depth', 'length', 'direction', '_food', 'iteration',
+                 'food_eaten', 'dead', 'won', '_zobrist')
+
+    def __init__(self, base, path, depth, length, direction, food, iteration, food_eaten, dead=False, won=False,
+                 zobrist=0):
+        self._base = base
+        self._zobrist = zobrist
+        self._path = path
+        self._depth = depth
+        self.length = length
+        self.direction = direction
+        self._food = food
+        self.iteration = iteration
+        self.food_eaten = food_eaten
+        self.dead = dead
+        self.won = won
+
+    @classmethod
+    def from_game(cls, game):
+        """Takes a snapshot of a Game (or of the game of an App). Costs O(length + cells)."""
+
+        game = getattr(game, 'game', game)
+        free = game.free_cells.copy()
+        geometry = (game.n_cols, game.n_rows, game.cell_size, game.margin_left, game.margin_top)
+        base = _Base(geometry, [game.cell_index(cell) for cell in game.snake.body], free,
+                     game.rng.bit_generator.state)
+        food = None if game.food_pos is None else game.cell_index(game.food_pos)
+
+        return cls(base, None, 0, len(game.snake.body), game.snake.current_direction, food,
+                   game.iteration, game.score['food_eaten'], dead=game.will_die, won=game.won,
+                   zobrist=game._zobrist)
+
+    # ------------------------------------------------------------------------------
+    # Reading the state. Positions are given in pixels, like everywhere else.
+
+    def _position(self, cell):
+        n_cols, _, cs, margin_left, margin_top = self._base.geometry
+        row, col = divmod(cell, n_cols)
+        return [margin_left + col*cs, margin_top + row*cs]
+
+    def _cells(self):
+        """Returns the flat cells of the body, tail first and head last. Costs O(length)."""
+
+        newest = []
+        node = self._path
+        while node is not None and len(newest) < self.length:
+            newest.append(node.cell)
+            node = node.prev
+        newest.reverse()
+
+        missing = self.length - len(newest)
+        old = self._base.body[len(self._base.body)-missing:] if missing else ()
+        return list(old) + newest
+
+    @property
+    def done(self):
+        return self.dead or self.won
+
+    @property
+    def head(self):
+        return self._position(self._head_cell())
+
+    @property
+    def body(self):
+        """The body as a list of [xpos,ypos] cells, tail first and head last. Costs O(length)."""
+        return [self._position(cell) for cell in self._cells()]
+
+    @property
+    def food_pos(self):
+        return None if self._food is None else self._position(self._food)
+
+    @property
+    def score(self):
+        return {'food_eaten': self.food_eaten}
+
+    @property
+    def zobrist(self):
+        """64 bit Zobrist hash of the state, equal to Game.zobrist of the same position."""
+        return self._zobrist ^ self._base.keys.direction[DIRECTION_CODES[self.direction]]
+
+    def _head_cell(self):
+        return self._path.cell if self._path is not None else self._base.body[-1]
+
+    def occupies(self, cell):
+        """Returns True if the body covers the cell, given as a flat index. Costs O(depth)."""
+
+        base = self._base
+        n = len(base.body) + self._depth  # the body is the last length cells of base.body + path
+        first = n - self.length
+
+        # search the cells entered in this branch, newest first
+        node = self._path
+        k = n - 1
+        while node is not None and k >= first:
+            if node.cell == cell:
+                return True
+            node = node.prev
+            k -= 1
+        if k < first:
+            return False
+
+        i = base.index.get(cell)
+        return i is not None and i >= first
+
+    def _tail_cell(self):
+        base = self._base
+        first = len(base.body) + self._depth - self.length
+        if first < len(base.body):
+            return base.body[first]
+
+        node = self._path
+        for _ in range(self.length - 1):
+            node = node.prev
+        return node.cell
+
+    # ------------------------------------------------------------------------------
+    # Moving the state
+
+    def _next_cell(self, direction):
+        """Returns the flat index of the cell the head moves to, or None if it leaves the grid."""
+
+        n_cols, n_rows = self._base.geometry[:2]
+        row, col = divmod(self._head_cell(), n_cols)
+        dx, dy = STEPS[direction]
+        col, row = col + dx, row + dy
+        if 0 <= col < n_cols and 0 <= row < n_rows:
+            return row*n_cols + col
+        return None
+
+    def _resolve(self, action):
+        """Returns the direction the snake takes when given the action."""
+        if action is None or action == OPPOSITES[self.direction]:
+            return self.direction
+        if action not in STEPS:
+            raise ValueError(f'Wrong direction. Must be in {list(DIRECTIONS)} or None.')
+        return action
+
+    def _is_fatal(self, cell):
+        """Same rules as Game._is_fatal: leaving the grid or biting the body (the tail
+        is safe unless the snake eats)."""
+        if cell is None:
+            return True
+        if not self.occupies(cell):
+            return False
+        return cell == self._food or cell != self._tail_cell()
+
+    def legal_actions(self):
+        """Returns the directions that do not kill the snake in the next step."""
+
+        if self.done:
+            return []
+        opposite = OPPOSITES[self.direction]
+        return [direction for direction in DIRECTIONS
+                if direction != opposite and not self._is_fatal(self._next_cell(direction))]
+
+    def step(self, action=None):
+        """Returns the state after one step with the given action. This state is not changed."""
+
+        if self.done:
+            raise RuntimeError('The game is over. There is no next state.')
+
+        direction = self._resolve(action)
+        cell = self._next_cell(direction)
+        if self._is_fatal(cell):
+            return GameState(self._base, self._path, self._depth, self.length, direction, self._food,
+                             self.iteration+1, self.food_eaten, dead=True, zobrist=self._zobrist)
+
+        keys = self._base.keys
+        zobrist = self._zobrist ^ keys.head[self._head_cell()] ^ keys.head[cell] ^ keys.body[cell]
+        if cell != self._food:
+            tail = self._tail_cell()
+            state = GameState(self._base, _Node(cell, self._path), self._depth+1, self.length, direction,
+                              self._food, self.iteration+1, self.food_eaten)
+            state._zobrist = zobrist ^ keys.body[tail] ^ keys.tail[tail] ^ keys.tail[state._tail_cell()]
+            return state
+
+        return self._eat(cell, direction, zobrist)
+
+    def _eat(self, cell, direction, zobrist):
+        """Builds a new base for the state after eating and places the food like the real game would."""
+
+        base = self._base
+
+        # replay the moves of this branch on a copy of the free cells, in the order the game does them
+        path = []
+        node = self._path
+        while node is not None:
+            path.append(node.cell)
+            node = node.prev
+        path.reverse()
+        sequence = list(base.body) + path
+
+        free = base.free_cells.copy()
+        for j, head in enumerate(path):
+            free.add(sequence[j])
+            free.remove(head)
+        free.remove(cell)
+
+        # draw the new food with a copy of the random generator
+        body = sequence[len(sequence)-self.length:] + [cell]
+        food, won = None, True
+        rng = np.random.default_rng()
+        rng.bit_generator.state = base.rng_state
+        if free:
+            food, won = free.sample(rng), False
+
+        zobrist ^= base.keys.food[cell]
+        if food is not None:
+            zobrist ^= base.keys.food[food]
+
+        new_base = _Base(base.geometry, body, free, rng.bit_generator.state)
+        return GameState(new_base, None, 0, self.length+1, direction, food, self.iteration+1,
+                         self.food_eaten+1, won=won, zobrist=zobrist)
+
+    def simulate(self, actions):
+        """Returns the state after playing the given actions, stopping early if the game ends."""
+
+        state = self
+        for action in actions:
+            if state.done:
+                break
+            state = state.step(action)
+        return state
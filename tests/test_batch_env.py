@@ -0,0 +1,30 @@
+import numpy as np
+
+from batch_env import ACTIONS, BatchGame
+
+
+def test_batch_steps_like_game():
+    batch = BatchGame(64, n_cols=8, n_rows=6, seed=0)
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        games = [batch.game(i) for i in range(batch.n_games)]
+        features = batch.features()
+        for i, game in enumerate(games):
+            assert np.array_equal(features[i], game.observe().features)
+
+        actions = rng.integers(-1, 4, size=batch.n_games)
+        episodes = batch.episodes.copy()
+        ate, done = batch.step(actions)
+
+        for i, game in enumerate(games):
+            _, game_ate, dead = game.step(None if actions[i] < 0 else ACTIONS[actions[i]])
+            assert ate[i] == game_ate
+            assert done[i] == game.done
+            if done[i]:
+                assert batch.episodes[i] == episodes[i] + 1
+                assert batch.final_won[i] == game.won
+                assert batch.final_food_eaten[i] == game.score['food_eaten']
+            elif not ate[i]:
+                # the food the game places after eating differs, the rest must not
+                assert batch.body_cells(i) == list(game.snake.body)
+                assert batch.food_cells()[i].tolist() == game.food_pos
@@ -0,0 +1,56 @@
+from engine import Game
+from events import BodyTracker
+from player import SimplePlayer
+
+
+def check_tracker(tracker, game):
+    assert list(tracker.body) == [game.cell_index(pos) for pos in game.snake.body]
+    assert tracker.food == game._food_cell
+    assert tracker.food_eaten == game.score['food_eaten']
+    assert tracker.alive == (not game.done)
+
+
+def test_tracker_follows_every_step():
+    game = Game((100, 100), seed=0)
+    tracker = BodyTracker()
+    game.subscribe(tracker, batch_steps=1)
+    player = SimplePlayer()
+    for seed in range(5):
+        game.reset(seed)
+        while not game.done:
+            game.step(player(game))
+            check_tracker(tracker, game)
+
+
+def test_subscribe_mid_game():
+    game = Game((100, 100), seed=3)
+    player = SimplePlayer()
+    for _ in range(200):
+        game.step(player(game))
+    assert len(game.snake.body) > 1 and not game.done
+
+    # pending events of an earlier subscriber must not reach the new one twice
+    early = BodyTracker()
+    game.subscribe(early)
+    for _ in range(10):
+        game.step(player(game))
+
+    tracker = BodyTracker()
+    game.subscribe(tracker)
+    check_tracker(tracker, game)
+    game.play(player)
+    check_tracker(tracker, game)
+    check_tracker(early, game)
+
+
+def test_smallest_batch_wins():
+    game = Game((100, 100), seed=0)
+    calls = {'fast': 0, 'slow': 0}
+    game.subscribe(lambda events: calls.__setitem__('fast', calls['fast'] + 1), batch_steps=1)
+    game.subscribe(lambda events: calls.__setitem__('slow', calls['slow'] + 1), batch_steps=64)
+    calls.update(fast=0, slow=0)
+    for _ in range(10):
+        game.step()
+        if game.done:
+            break
+    assert calls['fast'] == calls['slow'] == game.iteration - 1
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from engine import Game
+from observation import Observation
+from player import SimplePlayer
+
+
+def check_observation(observation, game):
+    rebuilt = Observation(game, observation.body_age)
+    assert np.array_equal(observation.planes, rebuilt.planes)
+    assert np.array_equal(observation.features, rebuilt.features)
+
+
+@pytest.mark.parametrize('body_age', [False, True])
+def test_incremental_observation_matches_rebuilt(body_age):
+    game = Game((80, 60), seed=0)
+    observation = game.observe(body_age=body_age)
+    player = SimplePlayer()
+    for seed in range(4):
+        game.reset(seed)
+        check_observation(observation, game)
+        while not game.done:
+            game.step(player(game))
+            check_observation(observation, game)
+
+
+def test_snapshot_observation_follows_its_game():
+    game = Game((80, 60), seed=2)
+    game.observe()
+    player = SimplePlayer()
+    for _ in range(10):
+        game.step(player(game))
+
+    snapshot = game.snapshot()
+    snapshot.step(player(snapshot))
+    check_observation(snapshot.observation, snapshot)
+    check_observation(game.observation, game)
@@ -0,0 +1,30 @@
+import io
+
+import numpy as np
+
+from engine import Game
+from observation import Observation
+from player import BasePlayer, SimplePlayer
+from remote import BATCH, MAGIC, VERSION, encode_game, serve
+
+
+class ObservingPlayer(BasePlayer):
+    observation = 'body_age'
+
+    def my_bot(self, App):
+        rebuilt = Observation(App, body_age=True)
+        assert np.array_equal(App.observation.planes, rebuilt.planes)
+        assert np.array_equal(App.observation.features, rebuilt.features)
+        return 'up'
+
+
+def test_serve_observes_the_decoded_games():
+    game = Game((100, 100), seed=3)
+    player = SimplePlayer()
+    for _ in range(20):
+        game.step(player(game))
+
+    request = BATCH.pack(MAGIC, VERSION, 2) + encode_game(game) + encode_game(game) + BATCH.pack(MAGIC, VERSION, 0)
+    answer = io.BytesIO()
+    serve(ObservingPlayer(), io.BytesIO(request), answer)
+    assert answer.getvalue().endswith(bytes([0, 0]))
@@ -0,0 +1,30 @@
+from snake import Snake
+
+
+def grown_snake(length=5):
+    snake = Snake(50, 50, direction='right')
+    for _ in range(length-1):
+        snake.move(has_eaten=True)
+    return snake
+
+
+def test_body_reads_like_a_list():
+    snake = grown_snake()
+    assert snake.body[:-1] == [[50, 50], [60, 50], [70, 50], [80, 50]]
+    assert snake.body[-1] == [90, 50] and len(snake.body) == 5
+    assert snake.body == list(snake.body)
+
+
+def test_copies_do_not_affect_each_other():
+    snake = grown_snake()
+    body = list(snake.body)
+
+    ahead = snake.change_direction('down', return_copy=True)
+    ahead.move()
+    assert list(snake.body) == body and snake.current_direction == 'right'
+    assert ahead.body[-1] == [90, 60] and not snake.occupies([90, 60])
+
+    behind = snake.change_direction('up', return_copy=True)
+    snake.move()
+    assert list(behind.body) == body and behind.occupies([50, 50])
+    assert not snake.occupies([50, 50])
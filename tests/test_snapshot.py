@@ -0,0 +1,46 @@
+from async_player import AsyncPlayer
+from batch_env import BatchGame
+from engine import DIRECTIONS, Game
+from player import SimplePlayer
+
+
+def test_snapshot_places_the_same_food():
+    game = Game((100, 100), seed=7)
+    player = SimplePlayer()
+    snapshots = []
+    while not game.done:
+        snapshots.append(game.snapshot())
+        game.step(player(game))
+
+    # replay every snapshot to the end, long after the game has moved on
+    for snapshot in snapshots[::10]:
+        for code in game.directions_taken[snapshot.iteration-1:]:
+            snapshot.step(DIRECTIONS[code])
+        assert snapshot.food_pos == game.food_pos
+        assert snapshot.zobrist == game.zobrist
+        assert snapshot.score == game.score
+
+
+def test_snapshot_of_games_without_free_cell_index():
+    game = Game(seed=1).snapshot().snapshot()
+    game.step()
+    assert game.iteration == 2
+
+    batch = BatchGame(4, 10, 10, seed=0)
+    assert batch.play(AsyncPlayer(SimplePlayer()), 3) >= 0
+
+
+def test_reset_frees_the_cells_in_the_order_of_a_new_index():
+    game = Game((100, 100), seed=0)
+    player = SimplePlayer()
+    for seed in range(1, 4):
+        snapshot = game.snapshot()
+        while not game.done:
+            game.step(player(game))
+        game.reset(seed)
+        new = Game((100, 100), seed=seed)
+        assert game.free_cells.cells == new.free_cells.cells
+        assert game.free_cells.pos == new.free_cells.pos
+        assert game.food_pos == new.food_pos
+        # the snapshot taken before the reset still rebuilds its own index
+        assert snapshot.free_cells.size == 100 - len(snapshot.snake.body)
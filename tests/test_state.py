@@ -0,0 +1,46 @@
+import numpy as np
+
+from engine import DIRECTIONS, Game
+from player import SimplePlayer
+from state import GameState
+
+
+def check_state(state, game):
+    assert state.body == list(game.snake.body)
+    assert state.food_pos == game.food_pos
+    assert state.food_eaten == game.score['food_eaten']
+    assert state.iteration == game.iteration
+    assert state.done == game.done
+    assert state.zobrist == game.zobrist
+
+
+def test_state_steps_like_game():
+    player = SimplePlayer()
+    rng = np.random.default_rng(0)
+    for seed in range(3):
+        game = Game((100, 100), seed=seed)
+        root = GameState.from_game(game)
+        root_body = root.body
+
+        state = root
+        while not game.done:
+            # mostly the bot, sometimes a random (possibly fatal) turn
+            action = player(game) if rng.random() < 0.9 else DIRECTIONS[rng.integers(4)]
+            state = state.step(action)
+            game.step(action)
+            check_state(state, game)
+
+        # the states the search started from are left as they were
+        assert root.body == root_body and root.iteration == 1 and not root.done
+
+
+def test_state_from_snapshot_predicts_the_food():
+    # bots in the App and behind an AsyncPlayer get a snapshot, not the live game
+    player = SimplePlayer()
+    for seed in range(5):
+        game = Game((100, 100), seed=seed)
+        while not game.done:
+            action = player(game)
+            predicted = GameState.from_game(game.snapshot()).step(action)
+            game.step(action)
+            check_state(predicted, game)
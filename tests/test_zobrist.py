@@ -0,0 +1,46 @@
+from engine import DIRECTION_CODES, Game
+from player import SimplePlayer
+from zobrist import TranspositionTable
+
+
+def full_hash(game):
+    body = [game.cell_index(pos) for pos in game.snake.body]
+    food = None if game.food_pos is None else game.cell_index(game.food_pos)
+    return game._keys.hash(body, food) ^ game._keys.direction[DIRECTION_CODES[game.snake.current_direction]]
+
+
+def test_incremental_hash_matches_full_hash():
+    game = Game((80, 80), seed=0)
+    player = SimplePlayer()
+    for seed in range(5):
+        game.reset(seed)
+        assert game.zobrist == full_hash(game)
+        while not game.done:
+            game.step(player(game))
+            assert game.zobrist == full_hash(game)
+
+
+def test_hash_follows_copies_and_rehash():
+    game = Game((80, 80), seed=1)
+    player = SimplePlayer()
+    for _ in range(20):
+        game.step(player(game))
+    assert not game.done
+    assert game.copy().zobrist == game.snapshot().zobrist == game.zobrist
+
+    # moving the food by hand needs a rehash
+    food = next(cell for cell in range(game.n_cols*game.n_rows)
+                if cell != game.cell_index(game.food_pos) and not game.snake.occupies(game.cell_position(cell)))
+    before = game.zobrist
+    game.food_pos = game.cell_position(food)
+    game.rehash()
+    assert game.zobrist == full_hash(game) != before
+
+
+def test_transposition_table_evicts_least_recently_used():
+    table = TranspositionTable(capacity=2)
+    table.put(1, 'a')
+    table.put(2, 'b')
+    table.get(1)
+    table.put(3, 'c')
+    assert 1 in table and 3 in table and 2 not in table
@@ -0,0 +1,207 @@
+'''
+Tournament runner that evaluates bots over many seeded headless games.
+The games are spread over a process pool and the results are aggregated into
+a table with 95% confidence intervals. Every game is reproducible from its seed.
+
+$ python tournament.py --players SimplePlayer RandomPlayer --seeds 0 1000 --results results.db
+
+With --results, every worker appends the games it played to a results.ResultsStore.
+'''
+
+import argparse
+import cProfile
+import multiprocessing as mp
+import os
+import pstats
+from time import perf_counter
+
+import numpy as np
+
+import player as players
+from engine import Game
+from profiler import Profiler, CProfiledPlayer
+from results import ResultsStore
+
+
+def play_game(player_class, seed, board=None, max_steps=100000, profiler=None, cprofile=None):
+    """
+    Plays one headless game and returns its statistics as a dict.
+    The global NumPy random state is seeded as well, so that bots that use
+    np.random (like RandomPlayer) are reproducible too. A profiler.Profiler
+    records the phases of the game, a cProfile.Profile the bot's decisions.
+    """
+
+    np.random.seed(seed)
+    game = Game(seed=seed, **(board or {}))
+    game.profiler = profiler
+    bot = player_class()
+    if bot.observation:
+        game.observe(body_age=bot.observation == 'body_age')
+    if cprofile is not None:
+        bot = CProfiledPlayer(bot, cprofile)
+
+    decision_time = 0.
+    max_decision_time = 0.
+    while not game.done and game.iteration <= max_steps:
+        tstart = perf_counter()
+        action = bot(game)
+        elapsed = perf_counter() - tstart
+
+        decision_time += elapsed
+        if elapsed > max_decision_time:
+            max_decision_time = elapsed
+        if profiler is not None:
+            profiler.record('bot_decision', elapsed)
+
+        game.step(action)
+
+    steps = game.iteration - 1
+    food_eaten = game.score['food_eaten']
+    return {'bot_name': bot.bot_name,
+            'bot_version': bot.bot_version,
+            'seed': seed,
+            'n_cols': game.n_cols,
+            'n_rows': game.n_rows,
+            'food_eaten': food_eaten,
+            'steps': steps,
+            'won': game.won,
+            'steps_per_food': steps / food_eaten if food_eaten else float('nan'),
+            'mean_latency': decision_time / max(steps, 1),
+            'max_latency': max_decision_time}
+
+
+def _play_games(task):
+    """
+    Worker function: plays a chunk of seeds with one player class. Returns the results,
+    the profiler of the chunk (or None) and the file its cProfile statistics were saved
+    to (or None), which run_tournament merges. The results are also appended to the
+    results store at results_path in one transaction, if it is given.
+    """
+
+    player_class, seeds, board, max_steps, profile, cprofile_path, results_path = task
+    profiler = Profiler() if profile else None
+    cprofile = cProfile.Profile() if cprofile_path else None
+
+    results = [play_game(player_class, seed, board, max_steps, profiler, cprofile) for seed in seeds]
+    if results_path is not None:
+        with ResultsStore(results_path) as store:
+            store.add_many(results)
+
+    cprofile_file = None
+    if cprofile is not None:
+        cprofile_file = f'{cprofile_path}.{os.getpid()}.{seeds[0]}.{player_class.__name__}'
+        cprofile.dump_stats(cprofile_file)
+    return results, profiler, cprofile_file
+
+
+def _confidence_interval(values):
+    """Returns the mean and the half width of its 95% confidence interval (normal approximation)."""
+
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return float('nan'), float('nan')
+    if len(values) == 1:
+        return values[0], float('nan')
+    return values.mean(), 1.96 * values.std(ddof=1) / np.sqrt(len(values))
+
+
+def summarize(results):
+    """Aggregates the per-game results into one row per bot."""
+
+    rows = []
+    for bot_name in dict.fromkeys(result['bot_name'] for result in results):
+        games = [result for result in results if result['bot_name'] == bot_name]
+        total_steps = sum(game['steps'] for game in games)
+        rows.append({'bot_name': bot_name,
+                     'games': len(games),
+                     'wins': sum(game['won'] for game in games),
+                     'food_eaten': _confidence_interval([game['food_eaten'] for game in games]),
+                     'steps': _confidence_interval([game['steps'] for game in games]),
+                     'steps_per_food': _confidence_interval([game['steps_per_food'] for game in games]),
+                     'mean_latency': sum(game['mean_latency']*game['steps'] for game in games) / max(total_steps, 1),
+                     'max_latency': max(game['max_latency'] for game in games)})
+    return rows
+
+
+def format_table(rows):
+    """Formats the summary rows as a plain text table."""
+
+    header = f'{"bot":<16}{"games":>7}{"wins":>6}{"food eaten":>18}{"steps":>22}{"steps/food":>18}{"mean us":>10}{"max us":>10}'
+    lines = [header, '-'*len(header)]
+    for row in rows:
+        def ci(key, fmt):
+            return f'{row[key][0]:{fmt}} ± {row[key][1]:{fmt}}'
+        lines.append(f'{row["bot_name"]:<16}{row["games"]:>7}{row["wins"]:>6}'
+                     f'{ci("food_eaten", ".2f"):>18}{ci("steps", ".1f"):>22}{ci("steps_per_food", ".2f"):>18}'
+                     f'{1e6*row["mean_latency"]:>10.1f}{1e6*row["max_latency"]:>10.1f}')
+    return '\n'.join(lines)
+
+
+def run_tournament(player_classes, seeds, board=None, processes=None, max_steps=100000, chunksize=16,
+                   profiler=None, cprofile_path=None, results_path=None):
+    """
+    Plays every player class on every seed and returns the list of per-game results.
+    board holds keyword arguments for Game (e.g. grid_size, cell_size).
+    The games are distributed over a pool of processes (default: one per core).
+    The phase timings of all workers are merged into profiler, if given, and the
+    cProfile statistics of all bots are saved to cprofile_path, if given. The workers
+    append every game to the results.ResultsStore at results_path, if given.
+    """
+
+    seeds = list(seeds)
+    if results_path is not None:
+        ResultsStore(results_path).close()  # create the tables before the workers race to do it
+    tasks = [(player_class, seeds[i:i+chunksize], board, max_steps, profiler is not None, cprofile_path,
+              results_path)
+             for player_class in player_classes
+             for i in range(0, len(seeds), chunksize)]
+
+    if processes == 1:
+        chunks = list(map(_play_games, tasks))
+    else:
+        with mp.Pool(processes) as pool:
+            chunks = pool.map(_play_games, tasks)
+
+    if profiler is not None:
+        for _, chunk_profiler, _ in chunks:
+            profiler.merge(chunk_profiler)
+
+    if cprofile_path is not None:
+        files = [cprofile_file for _, _, cprofile_file in chunks]
+        pstats.Stats(*files).dump_stats(cprofile_path)
+        for f in files:
+            os.remove(f)
+
+    return [result for results, _, _ in chunks for result in results]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate snake bots over many seeded headless games.')
+    parser.add_argument('--players', nargs='+', default=['SimplePlayer', 'RandomPlayer'],
+                        help='names of player classes in player.py')
+    parser.add_argument('--seeds', nargs=2, type=int, default=[0, 1000], metavar=('FIRST', 'LAST'),
+                        help='range of seeds to play, last one excluded')
+    parser.add_argument('--board', nargs=2, type=int, default=[40, 40], metavar=('COLUMNS', 'ROWS'),
+                        help='board size in cells')
+    parser.add_argument('--cell-size', type=int, default=10, help='cell size in pixels')
+    parser.add_argument('--max-steps', type=int, default=100000, help='maximum number of steps per game')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--profile', default=None, help='export phase timings to this .json or .csv file')
+    parser.add_argument('--cprofile', default=None, help='run cProfile on the bots and save the stats to this file')
+    parser.add_argument('--results', default=None, help='append every game to this results database')
+    args = parser.parse_args()
+
+    player_classes = [getattr(players, name) for name in args.players]
+    board = {'grid_size': (args.board[0]*args.cell_size, args.board[1]*args.cell_size), 'cell_size': args.cell_size}
+
+    tstart = perf_counter()
+    profiler = Profiler() if args.profile is not None else None
+    results = run_tournament(player_classes, range(*args.seeds), board, args.processes, args.max_steps,
+                             profiler=profiler, cprofile_path=args.cprofile, results_path=args.results)
+    print(format_table(summarize(results)))
+    print(f'\n{len(results)} games in {perf_counter()-tstart:.1f} s')
+
+    if profiler is not None:
+        print('\n' + profiler.report())
+        profiler.export(args.profile)
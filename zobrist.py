@@ -0,0 +1,122 @@
+'''
+Zobrist hashing of game states and a transposition table for search bots.
+
+Every cell of the board gets a random 64 bit key for "body", "head", "tail"
+and "food", and every direction gets one too. The hash of a state is the XOR
+of the keys of what is on the board, so moving the snake or the food changes
+it by XORing a handful of keys in and out, which is O(1) per step:
+
+    game.zobrist                            # kept up to date by Game.step
+    GameState.from_game(game).zobrist       # and by GameState.step
+
+The hash covers the cells of the body, the head, the tail, the food and the
+current direction. Two states only share it if they agree on all of these (or
+by a 64 bit collision); it does not tell apart two bodies that cover the same
+cells with the same ends in a different order.
+
+A TranspositionTable memoises evaluations by hash with least recently used
+replacement and counts its hits, misses and evictions, so it can be sized:
+
+    table = TranspositionTable(capacity=100000)
+    value = table.get(state.zobrist)
+    if value is None:
+        value = table.put(state.zobrist, evaluate(state))
+    table.stats()
+'''
+
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+
+class ZobristKeys:
+    """The random keys of the cells of a board with n_cells cells."""
+
+    def __init__(self, n_cells, seed=0):
+        rng = np.random.default_rng(seed)
+        keys = rng.integers(0, 2**64, size=(4, n_cells), dtype=np.uint64)
+
+        # plain lists of Python ints XOR faster than NumPy scalars
+        self.body, self.head, self.tail, self.food = (row.tolist() for row in keys)
+        # one key per direction code (see engine.DIRECTION_CODES)
+        self.direction = rng.integers(0, 2**64, size=4, dtype=np.uint64).tolist()
+
+    def hash(self, body, food=None):
+        """
+        Returns the hash of a board from scratch, without the direction: body is the list
+        of flat cells of the snake, tail first and head last, food the flat cell of the
+        food or None. Costs O(length).
+        """
+
+        h = self.head[body[-1]] ^ self.tail[body[0]]
+        for cell in body:
+            h ^= self.body[cell]
+        if food is not None:
+            h ^= self.food[food]
+        return h
+
+
+@lru_cache(maxsize=None)
+def keys_for(n_cells):
+    """Returns the keys of boards with n_cells cells. All games of the same size share them,
+    so hashes can be compared across games, copies and search branches."""
+    return ZobristKeys(n_cells)
+
+
+class TranspositionTable:
+    """A bounded dict from state hashes to values that evicts the least recently used entry."""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Tells whether key is stored, without counting a hit or a miss."""
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value stored for key and marks it as recently used, or default."""
+
+        value = self._entries.get(key, self)
+        if value is self:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Stores value for key, evicting the least recently used entry if the table is full.
+        Returns value."""
+
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+        elif len(entries) >= self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+        entries[key] = value
+        return value
+
+    def clear(self):
+        """Removes all entries. The counters are kept."""
+        self._entries.clear()
+
+    def stats(self):
+        """Returns the size, the counters and the hit rate."""
+
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else float('nan')}